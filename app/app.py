@@ -1,5 +1,5 @@
 from flask import Flask, request, render_template_string
-from google.cloud import bigquery
+from storage import get_storage
 import folium
 import pandas as pd
 import geopandas as gpd
@@ -15,6 +15,11 @@ with open('config/bigquery_config.json', 'r') as f:
 with open('config/folium_config.json', 'r') as f:
     folium_config = json.load(f)
 
+with open('config/storage_config.json', 'r') as f:
+    storage_config = json.load(f)
+
+storage = get_storage(storage_config, bigquery_config)
+
 @app.route("/")
 def index():
     # Extract filter parameters
@@ -98,13 +103,12 @@ def index():
         g.geometry as geometry
         """
 
-    # Build a BigQuery query with these parameters
+    # Build the stats query with these parameters
     # Adjust this query as per your actual schema and filters
-    client = bigquery.Client()
     query = f"""
     {select}
-    FROM `{bigquery_config['project_id']}.{bigquery_config['dataset_id']}.stats` s
-    LEFT JOIN `{bigquery_config['project_id']}.{bigquery_config['dataset_id']}.geodata_{region_resolution_column}` g
+    FROM {storage.table('stats')} s
+    LEFT JOIN {storage.table(f'geodata_{region_resolution_column}')} g
     """
     
     if region_resolution in ['wijk', 'buurt']:
@@ -123,7 +127,7 @@ def index():
     
     print(query)
     
-    df = client.query(query).to_dataframe()
+    df = storage.query(query)
     df["geometry"] = df["geometry"].apply(wkt.loads)
     gdf = gpd.GeoDataFrame(df, geometry='geometry', crs="EPSG:28992")
     gdf['stadsdeel'] = gdf['stadsdeel'].str.replace('Stadsdeel ', '',regex=False)
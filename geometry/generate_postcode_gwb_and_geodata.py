@@ -3,17 +3,46 @@ import sys
 import os
 import requests
 import zipfile
+import logging
 import datetime
 import geopandas as gpd
 import shutil
 from shapely import wkt
 from shapely.geometry import MultiPolygon, Polygon
+from http_cache import HttpCache
 
 # GWB: Gemeente - Wijk - Buurt
 
 # Data from https://www.cbs.nl/nl-nl/maatwerk/2024/35/buurt-wijk-en-gemeente-2024-voor-postcode-huisnummer and https://www.cbs.nl/nl-nl/dossier/nederland-regionaal/geografische-data/wijk-en-buurtkaart-2024
 
-def generate_postcode_gwb_and_geodata_tables(selected_gemeenten, tmp_dir, output_dir, buurt_to_stadsdeel_mapping_path=None):
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# CBS publishes these files once a year, so downloads are kept between runs
+cache_dir = 'cache'
+cache_ttl_seconds = 7*24*3600
+cache_max_bytes = 2*1024*1024*1024
+
+
+def download(url, path, cache=None):
+    cached = cache.get(url) if cache is not None else None
+    if cached is not None and cached['fresh']:
+        content = cached['content']
+    else:
+        headers = cache.validators(cached) if cached is not None else {}
+        response = requests.get(url, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            cache.touch(url, cached)
+            content = cached['content']
+        else:
+            response.raise_for_status()
+            content = response.content
+            if cache is not None:
+                cache.put(url, response.status_code, response.headers, content, response.url)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def generate_postcode_gwb_and_geodata_tables(selected_gemeenten, tmp_dir, output_dir, buurt_to_stadsdeel_mapping_path=None, cache=None):
     ### Using data from: https://www.cbs.nl
     
     # NOTE: A lot of demographic and other data is available in the kaart data. Maybe use this later for something.
@@ -33,17 +62,13 @@ def generate_postcode_gwb_and_geodata_tables(selected_gemeenten, tmp_dir, output
         try:
             # Download the pc6 ZIP file
             print(f"Downloading ZIP file from {pc6_url}...")
-            response = requests.get(pc6_url)
-            with open(pc6_zip_path, 'wb') as f:
-                f.write(response.content)
+            download(pc6_url, pc6_zip_path, cache)
             print("PC6 download completed.")
             pc6_downloaded = True
             
             # Download the kaart ZIP file
             print(f"Downloading ZIP file from {kaart_url}...")
-            response = requests.get(kaart_url)
-            with open(kaart_zip_path, 'wb') as f:
-                f.write(response.content)
+            download(kaart_url, kaart_zip_path, cache)
             print("Kaart download completed.")
             kaart_downloaded = True
              
@@ -292,13 +317,15 @@ def main():
     output_dir = "geodata"
     os.makedirs(tmp_dir, exist_ok=True)
     os.makedirs(output_dir, exist_ok=True)
+    cache = HttpCache(cache_dir, ttl_seconds=cache_ttl_seconds, max_bytes=cache_max_bytes)
     
     try:
         downloaded = generate_postcode_gwb_and_geodata_tables(
             selected_gemeenten, 
             tmp_dir, 
             output_dir, 
-            buurt_to_stadsdeel_mapping_path='geodata/buurt_stadsdeel_mapping.csv'
+            buurt_to_stadsdeel_mapping_path='geodata/buurt_stadsdeel_mapping.csv',
+            cache=cache
             )
         if downloaded:
             print("Table generation completed successfully.")
@@ -307,6 +334,8 @@ def main():
     except Exception as e:
         print(f"An error occurred while generating the table: {e}")
         
+    cache.log_report()
+
     # Clean up temporary directory
     shutil.rmtree(tmp_dir)
     print("Temporary directory cleaned up.")
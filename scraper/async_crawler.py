@@ -0,0 +1,157 @@
+import asyncio
+import functools
+import httpx
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from checkpoint import search_key
+
+max_tries = 5
+
+
+class ParariusAsyncCrawler():
+    # Fetches Pararius result pages concurrently over one pooled AsyncClient.
+    # Parsing and flushing are delegated back to the Scraper so the extracted
+    # records are the same as in the sequential crawl. They run, with the
+    # cache and archive I/O, on a single worker thread: the event loop keeps
+    # fetching while a page is parsed or a flush waits for room in the queue,
+    # and the Scraper's buffer and frontier are only touched by that thread.
+
+    def __init__(self, scraper, max_concurrency_per_host=4):
+        self.scraper = scraper
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self.host_semaphores = {}
+        self.executor = None
+
+    def run(self, searches):
+        asyncio.run(self.crawl(searches))
+
+    async def crawl(self, searches):
+        # Pararius is served from two hosts (pararius.nl for Buy, pararius.com for Rent)
+        limits = httpx.Limits(
+            max_connections=2*self.max_concurrency_per_host,
+            max_keepalive_connections=2*self.max_concurrency_per_host
+        )
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            self.executor = executor
+            async with httpx.AsyncClient(limits=limits, follow_redirects=True, timeout=30) as client:
+                await asyncio.gather(*[self.crawl_search(client, search) for search in searches])
+            await self.blocking(self.scraper.flush)
+        self.executor = None
+
+    async def blocking(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(func, *args))
+
+    def host_semaphore(self, url):
+        host = urlparse(url).netloc
+        if host not in self.host_semaphores:
+            self.host_semaphores[host] = asyncio.Semaphore(self.max_concurrency_per_host)
+        return self.host_semaphores[host]
+
+    async def crawl_search(self, client, search):
+        _, post_type, property_type, city, _ = search
+        if self.scraper.pararius_url(city, post_type, property_type, 1) is None:
+            return
+        key = search_key(search)
+        state = self.scraper.frontier.get(key, {})
+        if state.get('done'):
+            logging.info(f'Skipping completed search: {key}')
+            return
+        logging.info(f'Running: pararius | {post_type} | {property_type} | {city}')
+        page = state.get('page', 0) + 1
+        total_pages = state.get('total_pages')
+        if page == 1:
+            total_pages, finished = await self.scrape_page(client, key, city, post_type, property_type, 1)
+            if finished:
+                await self.blocking(self.scraper.mark_search_done, key)
+                return
+            page = 2
+        else:
+            logging.info(f'{post_type} | {property_type} | {city} | Resuming at page {page}')
+        total_pages = total_pages or 100 # placeholder, same as the sequential crawl
+        while page <= total_pages:
+            window = range(page, min(page + self.max_concurrency_per_host, total_pages + 1))
+            results = await asyncio.gather(*[
+                self.scrape_page(client, key, city, post_type, property_type, p) for p in window
+            ])
+            page = window[-1] + 1
+            if any(finished for _, finished in results):
+                break
+        await self.blocking(self.scraper.mark_search_done, key)
+
+    async def scrape_page(self, client, key, city, post_type, property_type, page):
+        base_url = self.scraper.pararius_url(city, post_type, property_type, page)
+        # The host slot only covers the request
+        async with self.host_semaphore(base_url):
+            response = await self.fetch(client, base_url, page)
+        if response is None:
+            return None, True
+        return await self.blocking(self.process_page, response, key, city, post_type, property_type, page, base_url)
+
+    def process_page(self, response, key, city, post_type, property_type, page, base_url):
+        response.encoding = 'utf-8'
+        if self.scraper.archive is not None:
+            self.scraper.archive.write('pararius', base_url, response.text, city=city, post_type=post_type,
+                                       property_type=property_type, page=page)
+        try:
+            total_pages, finished = self.scraper.parse_pararius(response.text, city, post_type, page)
+        except Exception as e:
+            logging.info(f'Parsing page {page} failed: {e}')
+            return None, False
+        logging.info(f'{post_type} | {property_type} | {city} | Page {page} | Buffered listings: {len(self.scraper.buffer)}')
+        self.scraper.mark_page_done(key, page, total_pages)
+        self.scraper.maybe_flush()
+        return total_pages, finished
+
+    async def fetch(self, client, base_url, page):
+        tries = 0
+        err = None
+        rate_limiter = self.scraper.rate_limiter
+        metrics = self.scraper.metrics
+        http_cache = self.scraper.http_cache
+        cached = await self.blocking(http_cache.get, base_url) if http_cache is not None else None
+        if cached is not None and cached['fresh']:
+            metrics.count('pararius.cache_hits')
+            return self.scraper.cached_response(cached)
+        validators = await self.blocking(http_cache.validators, cached) if cached is not None else {}
+        while tries <= max_tries:
+            headers = self.scraper.generate_headers()
+            headers.update(validators)
+            # Slots are handed out per host, so concurrent pages overlap their
+            # network time and parsing but not the politeness interval
+            with metrics.timer('pararius.rate_limit_wait'):
+                await rate_limiter.wait_async(base_url)
+            try:
+                with metrics.timer('pararius.fetch'):
+                    response = await client.get(base_url, headers=headers)
+            except httpx.TimeoutException as errt:
+                logging.info('Timeout Error, retrying...')
+                rate_limiter.record(base_url, error=True)
+                metrics.count('pararius.retries')
+                err = errt
+                tries += 1
+                continue
+            except httpx.ConnectError as errc:
+                logging.info('Connection Error, retrying...')
+                rate_limiter.record(base_url, error=True)
+                metrics.count('pararius.retries')
+                err = errc
+                tries += 1
+                continue
+            rate_limiter.record_response(base_url, response)
+            if response.status_code == 304 and cached is not None:
+                await self.blocking(http_cache.touch, base_url, cached)
+                metrics.count('pararius.cache_revalidated')
+                return self.scraper.cached_response(cached)
+            if self.scraper.pararius_response_ok(response, base_url, page):
+                if http_cache is not None:
+                    await self.blocking(http_cache.put, base_url, response.status_code, response.headers,
+                                        response.content, response.url)
+                return response
+            metrics.count('pararius.retries')
+            tries += 1
+        if err is None:
+            logging.info('Exceded number of tries.')
+        else:
+            logging.info(f'Tries exceeded with error: {err}')
+        return None
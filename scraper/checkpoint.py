@@ -0,0 +1,63 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone, timedelta
+
+
+def search_key(search):
+    return '|'.join(str(part) for part in search)
+
+
+class Checkpoint():
+    # Crawl frontier of a Scraper.run, saved after every flush. The frontier
+    # maps each search key to the last page whose listings have been written
+    # and whether the search is complete. A state file is only resumed by a
+    # run with the same search config within max_age_hours.
+
+    def __init__(self, path, config, max_age_hours=24):
+        self.path = path
+        self.fingerprint = hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        self.max_age = timedelta(hours=max_age_hours)
+        self.flushed_rows = 0
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logging.info(f'Ignoring unreadable checkpoint {self.path}: {e}')
+            return {}
+        if state.get('fingerprint') != self.fingerprint:
+            logging.info('Checkpoint was written for a different config, starting from scratch.')
+            return {}
+        if datetime.now(timezone.utc) - datetime.fromisoformat(state['saved_at']) > self.max_age:
+            logging.info('Checkpoint is too old, starting from scratch.')
+            return {}
+        self.flushed_rows = state.get('flushed_rows', 0)
+        frontier = state.get('frontier', {})
+        done = sum(1 for s in frontier.values() if s.get('done'))
+        logging.info(f'Resuming from checkpoint: {done} completed searches, {self.flushed_rows} rows already flushed.')
+        return frontier
+
+    def save(self, frontier, rows):
+        self.flushed_rows += rows
+        state = {
+            'fingerprint': self.fingerprint,
+            'saved_at': datetime.now(timezone.utc).isoformat(),
+            'flushed_rows': self.flushed_rows,
+            'frontier': frontier
+        }
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,312 @@
+import argparse
+import hashlib
+import json
+import logging
+import time
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+import numpy as np
+import pandas as pd
+from storage import get_storage
+
+# Finds Pararius listings that are also on Funda and removes them. Listings
+# are compared only within blocks of the same post type, postcode and price
+# band, so the work grows with the number of listings rather than with the
+# number of pairs. Within a block a Pararius and a Funda listing match when
+# their prices are within price_tolerance of each other, their room counts
+# differ by at most max_room_difference and the token sets of their titles
+# (property type stripped, house number letters split off) have a Jaccard
+# similarity of at least title_threshold. Matches are grouped into clusters,
+# written to property_duplicate_cluster, and the Pararius members deleted.
+#
+# Only listings that are new or changed since the previous run are checked,
+# the date of the last run is kept in the pipeline_state table.
+
+watermark_name = 'dedup_watermark'
+listing_columns = ['url', 'post_type', 'page_source', 'postcode', 'price', 'rooms', 'property_type', 'title']
+token_pattern = r'[^\W\d_]+|\d+'
+cluster_schema = {
+    "cluster_id": "STRING",
+    "url": "STRING",
+    "post_type": "STRING",
+    "page_source": "STRING",
+    "price": "INTEGER",
+    "rooms": "INTEGER",
+    "title": "STRING",
+    "similarity": "FLOAT",
+    "keep": "BOOLEAN",
+    "detected_date": "DATE"
+}
+
+
+def clean_titles(df):
+    # Title without the property type, dashes as spaces, lower case
+    titles = df['title'].fillna('').astype(str)
+    types = df['property_type'].fillna('').astype(str)
+    stripped = pd.Series([t.replace(p, '') for t, p in zip(titles, types)], index=df.index)
+    return stripped.str.strip().str.replace('-', ' ', regex=False).str.lower()
+
+
+def title_tokens(df):
+    # 'Damrak 12-H', 'Damrak 12 h' and 'Damrak 12h' all give {damrak, 12, h}
+    return [frozenset(tokens) for tokens in clean_titles(df).str.findall(token_pattern)]
+
+
+def price_bands(price, price_tolerance):
+    # Bands of relative width price_tolerance: prices within the tolerance of
+    # each other are in the same or in neighbouring bands
+    price = price.astype('float64')
+    if price_tolerance <= 0:
+        return price.astype('int64')
+    return np.floor(np.log(price.clip(lower=1)) / np.log1p(price_tolerance)).astype('int64')
+
+
+def candidate_pairs(rows, price_tolerance, max_room_difference):
+    # Positions in rows of every (Pararius, other source) pair in the same
+    # block that passes the price and rooms checks
+    blocks = pd.DataFrame({
+        'position': np.arange(len(rows)),
+        'post_type': rows['post_type'].to_numpy(),
+        'postcode': rows['postcode'].to_numpy(),
+        'band': price_bands(rows['price'], price_tolerance).to_numpy()
+    })
+    pararius = (rows['page_source'] == 'Pararius').to_numpy()
+    left = blocks[pararius]
+    right = blocks[~pararius]
+    if price_tolerance > 0:
+        right = pd.concat([right.assign(band=right['band'] + offset) for offset in (-1, 0, 1)])
+    pairs = left.merge(right, on=['post_type', 'postcode', 'band'], suffixes=('_1', '_2'))
+    first = pairs['position_1'].to_numpy()
+    second = pairs['position_2'].to_numpy()
+    price = rows['price'].to_numpy(dtype='float64')
+    rooms = rows['rooms'].to_numpy(dtype='float64')
+    close = np.abs(price[first] - price[second]) <= price_tolerance * np.maximum(price[first], price[second])
+    close &= np.abs(rooms[first] - rooms[second]) <= max_room_difference
+    return first[close], second[close]
+
+
+def jaccard(first, second, tokens):
+    similarity = np.zeros(len(first))
+    for i, (a, b) in enumerate(zip(first, second)):
+        a, b = tokens[a], tokens[b]
+        if a or b:
+            similarity[i] = len(a & b) / len(a | b)
+    return similarity
+
+
+def cluster_labels(first, second, size):
+    # Union-find over the matched pairs, returns a root position per row
+    parent = list(range(size))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in zip(first, second):
+        ra, rb = root(a), root(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    return np.array([root(i) for i in range(size)])
+
+
+def find_clusters(rows, new_urls, title_threshold=0.6, price_tolerance=0.02, max_room_difference=1):
+    # rows holds every listing to consider, new_urls the urls of which at
+    # least one side of a match must be. Returns one row per listing in a
+    # duplicate cluster, with keep False for the Pararius listings.
+    rows = rows.dropna(subset=['postcode', 'price', 'rooms']).reset_index(drop=True)
+    first, second = candidate_pairs(rows, price_tolerance, max_room_difference)
+    is_new = rows['url'].isin(new_urls).to_numpy()
+    involved = is_new[first] | is_new[second]
+    first, second = first[involved], second[involved]
+    # Titles are only tokenized for rows that are part of a candidate pair
+    positions = np.unique(np.concatenate([first, second]))
+    tokens = dict(zip(positions, title_tokens(rows.iloc[positions])))
+    similarity = jaccard(first, second, tokens)
+    matched = similarity >= title_threshold
+    first, second, similarity = first[matched], second[matched], similarity[matched]
+    if len(first) == 0:
+        return pd.DataFrame(columns=list(cluster_schema))
+
+    members = np.unique(np.concatenate([first, second]))
+    best = pd.concat([
+        pd.Series(similarity, index=first),
+        pd.Series(similarity, index=second)
+    ]).groupby(level=0).max()
+    labels = cluster_labels(first, second, len(rows))
+    clusters = rows.iloc[members][[c for c in cluster_schema if c in rows.columns]].copy()
+    clusters['label'] = labels[members]
+    clusters['similarity'] = best.loc[members].to_numpy()
+    clusters['keep'] = clusters['page_source'] != 'Pararius'
+    # A cluster is named after its smallest (url, post_type)
+    clusters['key'] = clusters['url'] + '|' + clusters['post_type']
+    first_keys = clusters.sort_values('key').drop_duplicates('label').set_index('label')['key']
+    ids = {label: hashlib.sha1(key.encode('utf-8')).hexdigest()[:16] for label, key in first_keys.items()}
+    clusters['cluster_id'] = clusters['label'].map(ids)
+    clusters['detected_date'] = date.today()
+    return clusters[list(cluster_schema)].sort_values(['cluster_id', 'page_source', 'url']).reset_index(drop=True)
+
+
+def load_new_listings(storage, watermark):
+    columns = ', '.join(listing_columns)
+    if watermark is None:
+        return storage.query(f"SELECT {columns} FROM {storage.table('property')}")
+    return storage.query(f"""
+        SELECT {columns} FROM {storage.table('property')}
+        WHERE first_scrape_date >= DATE '{watermark}'
+        OR url IN (
+            SELECT url FROM {storage.table('property_history')}
+            WHERE change_date >= DATE '{watermark}' AND change_type IN ('new', 'changed')
+        )
+    """)
+
+
+def load_block_rows(storage, new):
+    # Every listing sharing a postcode with a new listing, the only rows a new
+    # listing can be a duplicate of
+    postcodes = pd.DataFrame({'postcode': new['postcode'].dropna().unique()})
+    storage.truncate_write(postcodes, 'tmp_dedup_postcodes', schema={'postcode': 'STRING'})
+    try:
+        return storage.query(f"""
+            SELECT {', '.join(listing_columns)}
+            FROM {storage.table('property')}
+            WHERE postcode IN (SELECT postcode FROM {storage.table('tmp_dedup_postcodes')})
+        """)
+    finally:
+        storage.drop('tmp_dedup_postcodes')
+
+
+def delete_listings(storage, urls):
+    storage.truncate_write(pd.DataFrame({'url': urls}), 'temp_urls_to_remove', schema={'url': 'STRING'})
+    try:
+        storage.execute(f"""
+            DELETE FROM {storage.table('property')}
+            WHERE page_source = 'Pararius'
+            AND url IN (SELECT url FROM {storage.table('temp_urls_to_remove')})
+        """)
+    finally:
+        storage.drop('temp_urls_to_remove')
+
+
+def deduplicate(storage, full=False, title_threshold=0.6, price_tolerance=0.02, max_room_difference=1,
+                delete_duplicates=True):
+    run_date = datetime.now(tz=ZoneInfo("Europe/Amsterdam")).strftime('%Y-%m-%d')
+    watermark = None if full else storage.read_state(watermark_name)
+    new = load_new_listings(storage, watermark)
+    logging.info(f"Deduplicating {len(new)} listings new since {watermark or 'the beginning'}.")
+    if len(new) > 0:
+        rows = new if watermark is None else load_block_rows(storage, new)
+        clusters = find_clusters(rows, set(new['url']), title_threshold, price_tolerance, max_room_difference)
+        if len(clusters) > 0:
+            # A cluster found again keeps the date it was first detected on
+            storage.merge_upsert(clusters, 'property_duplicate_cluster', keys=['cluster_id', 'url'],
+                                 schema=cluster_schema, update_columns=['post_type', 'page_source', 'price', 'rooms',
+                                                                        'title', 'similarity', 'keep'])
+            to_remove = sorted(clusters.loc[~clusters['keep'], 'url'].unique())
+            if delete_duplicates:
+                delete_listings(storage, to_remove)
+            logging.info(f"Found {clusters['cluster_id'].nunique()} duplicate clusters, "
+                         f"{'removed' if delete_duplicates else 'not removing'} {len(to_remove)} Pararius listings.")
+    storage.write_state(watermark_name, run_date)
+
+
+def synthetic_listings(size, duplicate_share=0.3, seed=0):
+    # Funda listings plus Pararius listings, a duplicate_share of which are
+    # copies of a Funda listing with a few euros of price difference, the odd
+    # room count off by one and a differently written house number. Returns
+    # the listings and the urls of the Pararius copies.
+    rng = np.random.default_rng(seed)
+    funda_count = size // 2
+    pararius_count = size - funda_count
+    copies = min(int(pararius_count * duplicate_share), funda_count)
+    postcodes = np.array([f'{n} {a}{b}' for n in range(1000, 5000) for a in 'ABCDEFGHJK' for b in 'ABCDEFGHJK'])
+    streets = np.array([f'{prefix}{suffix}' for prefix in ['Heren', 'Keizers', 'Prinsen', 'Lijnbaans', 'Bloem',
+                                                            'Rozen', 'Egelantiers', 'Looier', 'Brouwers', 'Singel']
+                        for suffix in ['gracht', 'straat', 'dwarsstraat', 'kade', 'plein', 'laan']])
+
+    def listings(count):
+        numbers = rng.integers(1, 400, count)
+        letters = rng.choice(['', '', '', 'H', 'A', 'B'], count)
+        return pd.DataFrame({
+            'postcode': rng.choice(postcodes, count),
+            'price': np.round(rng.lognormal(7.5, 0.4, count)).astype('int64'),
+            'rooms': rng.integers(1, 6, count),
+            'street': rng.choice(streets, count),
+            'number': numbers,
+            'letter': letters
+        })
+
+    funda = listings(funda_count)
+    funda['page_source'] = 'Funda'
+    funda['url'] = [f'https://www.funda.nl/{i}' for i in range(funda_count)]
+    funda['property_type'] = 'Apartment'
+    funda['title'] = funda['street'] + ' ' + funda['number'].astype(str) + np.where(funda['letter'] != '', '-' + funda['letter'], '')
+
+    copied = funda.sample(copies, random_state=seed).reset_index(drop=True)
+    copied['price'] = copied['price'] + rng.integers(-10, 11, copies)
+    copied['rooms'] = np.clip(copied['rooms'] + rng.choice([0, 0, 0, 0, 1, -1], copies), 1, None)
+    separator = rng.choice([' ', '', '-'], copies)
+    copied['title'] = (copied['street'] + ' ' + copied['number'].astype(str)
+                       + np.where(copied['letter'] != '', separator + copied['letter'].str.lower(), ''))
+    others = listings(pararius_count - copies)
+    others['title'] = others['street'] + ' ' + others['number'].astype(str)
+    pararius = pd.concat([copied, others]).reset_index(drop=True)
+    pararius['page_source'] = 'Pararius'
+    pararius['url'] = [f'https://www.pararius.nl/{i}' for i in range(len(pararius))]
+    pararius['property_type'] = 'Appartement'
+    pararius['title'] = 'Appartement ' + pararius['title']
+
+    df = pd.concat([funda, pararius]).reset_index(drop=True)
+    df['post_type'] = 'Rent'
+    return df[listing_columns], set(pararius['url'].iloc[:copies])
+
+
+def benchmark(sizes, repeat=1, **params):
+    results = []
+    for size in sizes:
+        df, truth = synthetic_listings(size)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            clusters = find_clusters(df, set(df['url']), **params)
+        elapsed = (time.perf_counter() - start) / repeat
+        first, _ = candidate_pairs(df, params['price_tolerance'], params['max_room_difference'])
+        found = set(clusters.loc[~clusters['keep'], 'url'])
+        results.append({
+            'rows': size,
+            'candidate_pairs': len(first),
+            'clusters': clusters['cluster_id'].nunique(),
+            'precision': len(found & truth) / len(found) if found else None,
+            'recall': len(found & truth) / len(truth) if truth else None,
+            'seconds': elapsed,
+            'rows_per_s': size / elapsed if elapsed else None
+        })
+    return pd.DataFrame(results)
+
+
+def main():
+    with open('config/dedup_config.json', 'r') as f:
+        dedup_config = json.load(f)
+    parser = argparse.ArgumentParser(description='Remove Pararius listings that are duplicates of Funda listings.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run_parser = subparsers.add_parser('run', help='Deduplicate the property table.')
+    run_parser.add_argument('--full', action='store_true', help='Check the whole property table, not just new listings.')
+    bench_parser = subparsers.add_parser('benchmark', help='Time and score the matcher on synthetic listings.')
+    bench_parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    bench_parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        with open('config/bigquery_config.json', 'r') as f:
+            bigquery_config = json.load(f)
+        with open('config/storage_config.json', 'r') as f:
+            storage_config = json.load(f)
+        deduplicate(get_storage(storage_config, bigquery_config), full=args.full, **dedup_config)
+    elif args.command == 'benchmark':
+        params = {k: v for k, v in dedup_config.items() if k != 'delete_duplicates'}
+        print(benchmark(args.sizes, args.repeat, **params).to_string(index=False))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,91 @@
+import logging
+import threading
+import time
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+
+chromedriver_path = '/usr/local/bin/chromedriver'
+
+
+class DriverPool():
+    # Bounded pool of headless Chrome drivers. Drivers are started lazily,
+    # handed out to page jobs and recycled after max_pages_per_driver pages
+    # or as soon as a job reports a crash.
+
+    def __init__(self, user_agent_fn, size=1, max_pages_per_driver=50, page_load_timeout=60, metrics=None):
+        self.user_agent_fn = user_agent_fn
+        self.metrics = metrics
+        self.size = size
+        self.max_pages_per_driver = max_pages_per_driver
+        self.page_load_timeout = page_load_timeout
+        self.idle = []
+        self.pages_served = {}
+        self.started = 0
+        self.available = threading.Condition()
+
+    def create_driver(self):
+        start = time.perf_counter()
+        options = Options()
+        options.add_argument("--headless")
+        options.add_argument("--disable-gpu")
+        options.add_argument("--window-size=1920,1080")
+        options.add_argument("--start-maximized")
+        options.add_argument("--disable-blink-features=AutomationControlled")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument(f"user-agent={self.user_agent_fn()}")
+        try:
+            driver = webdriver.Chrome(service=Service(chromedriver_path), options=options)
+        except Exception:
+            # Fall back to Selenium Manager when chromedriver is not installed at the fixed path
+            driver = webdriver.Chrome(options=options)
+        driver.set_page_load_timeout(self.page_load_timeout)
+        self.pages_served[id(driver)] = 0
+        if self.metrics is not None:
+            self.metrics.observe('funda.driver_start', time.perf_counter() - start)
+        logging.info('Started new Chrome driver.')
+        return driver
+
+    def acquire(self):
+        with self.available:
+            while not self.idle and self.started >= self.size:
+                self.available.wait()
+            if self.idle:
+                return self.idle.pop()
+            self.started += 1
+        try:
+            return self.create_driver()
+        except Exception:
+            with self.available:
+                self.started -= 1
+                self.available.notify()
+            raise
+
+    def release(self, driver, crashed=False):
+        self.pages_served[id(driver)] = self.pages_served.get(id(driver), 0) + 1
+        if crashed or self.pages_served[id(driver)] >= self.max_pages_per_driver:
+            logging.info(f'Recycling Chrome driver after {self.pages_served[id(driver)]} pages{" (crashed)" if crashed else ""}.')
+            self.quit_driver(driver)
+            with self.available:
+                self.started -= 1
+                self.available.notify()
+            return
+        with self.available:
+            self.idle.append(driver)
+            self.available.notify()
+
+    def quit_driver(self, driver):
+        self.pages_served.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception as e:
+            logging.info(f'Error while quitting Chrome driver: {e}')
+
+    def close(self):
+        with self.available:
+            drivers, self.idle = self.idle, []
+            self.started -= len(drivers)
+        for driver in drivers:
+            self.quit_driver(driver)
+        logging.info('Chrome driver pool closed.')
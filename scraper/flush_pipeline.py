@@ -0,0 +1,57 @@
+import logging
+import queue
+import threading
+import time
+
+
+class FlushWorker():
+    # Writes batches on a background thread so scraping continues while the
+    # previous batch is loaded and merged. The queue is bounded: when the sink
+    # falls behind, submit() blocks the crawler until a slot frees up.
+
+    def __init__(self, write_fn, max_queue_size=2, on_flushed=None, metrics=None):
+        self.write_fn = write_fn
+        self.on_flushed = on_flushed
+        self.metrics = metrics
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.thread = threading.Thread(target=self.work, name='flush-worker', daemon=True)
+        self.failed_batches = 0
+        self.thread.start()
+
+    def submit(self, df, context=None):
+        start = time.monotonic()
+        self.queue.put((df, context, start))
+        waited = time.monotonic() - start
+        if self.metrics is not None:
+            self.metrics.observe('flush.queue_wait', waited)
+        if waited > 1:
+            logging.info(f'Flush queue was full, crawler waited {waited:.1f}s for the sink.')
+
+    def work(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                df, context, submitted = item
+                start = time.monotonic()
+                try:
+                    self.write_fn(df)
+                except Exception:
+                    self.failed_batches += 1
+                    logging.exception(f'Flushing batch of {len(df)} rows failed.')
+                    continue
+                logging.info(f'Flushed {len(df)} rows in {time.monotonic() - start:.1f}s.')
+                if self.metrics is not None:
+                    # From the crawler handing the batch over until it is in the table
+                    self.metrics.observe('flush.write', time.monotonic() - start)
+                    self.metrics.observe('flush.latency', time.monotonic() - submitted)
+                if self.on_flushed is not None:
+                    self.on_flushed(df, context)
+            finally:
+                self.queue.task_done()
+
+    def close(self):
+        # Waits until every submitted batch has been written
+        self.queue.put(None)
+        self.thread.join()
@@ -0,0 +1,61 @@
+import gzip
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+
+class HtmlArchive():
+    # Append-only archive of fetched result pages. Every run writes a new
+    # gzip-compressed JSON-lines segment; each record holds the source, the
+    # url, the fetch time, the search parameters and the raw html.
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        segment_name = f"pages-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{os.getpid()}.jsonl.gz"
+        self.segment_path = os.path.join(path, segment_name)
+        self.file = gzip.open(self.segment_path, 'at', encoding='utf-8')
+        self.lock = threading.Lock()
+        self.pages_written = 0
+        logging.info(f'Archiving fetched pages to {self.segment_path}')
+
+    def write(self, source, url, html, **params):
+        record = {
+            'source': source,
+            'url': url,
+            'fetched_at': datetime.now(timezone.utc).isoformat(),
+            'params': params,
+            'html': html
+        }
+        with self.lock:
+            self.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            self.pages_written += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+        logging.info(f'Archived {self.pages_written} pages to {self.segment_path}')
+
+
+def iter_archive(path, source=None):
+    # Yields records from a segment file or from every segment in a directory,
+    # oldest segment first. A segment cut short by a crash is read up to the
+    # last complete record.
+    if os.path.isdir(path):
+        segments = sorted(os.path.join(path, f) for f in os.listdir(path) if f.endswith('.jsonl.gz'))
+    else:
+        segments = [path]
+    for segment in segments:
+        try:
+            with gzip.open(segment, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    if source is None or record['source'] == source:
+                        yield record
+        except (EOFError, gzip.BadGzipFile) as e:
+            logging.info(f'Segment {segment} is truncated: {e}')
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+# Disk cache for GET responses, keyed by URL. Shipped with the scraper and
+# the geometry scripts, keep the copies in sync (scraper/tests checks it).
+#
+# Every entry is <sha256 of url>.body next to a .json file with the status,
+# final url, stored time and the validators (ETag, Last-Modified). Entries
+# younger than ttl_seconds are served without a request; older ones are
+# revalidated with If-None-Match/If-Modified-Since when they have validators.
+# Once the bodies exceed max_bytes the least recently used ones are evicted.
+
+kept_headers = ['content-type', 'etag', 'last-modified']
+
+
+class HttpCache():
+
+    def __init__(self, path, ttl_seconds=12*3600, max_bytes=500*1024*1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+        self.size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path) if name.endswith('.body'))
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def entry_path(self, url, ext):
+        return os.path.join(self.path, hashlib.sha256(url.encode('utf-8')).hexdigest() + ext)
+
+    def get(self, url):
+        # Returns the cached entry with its content and a 'fresh' flag, or None
+        try:
+            with open(self.entry_path(url, '.json'), 'r') as f:
+                entry = json.load(f)
+            with open(self.entry_path(url, '.body'), 'rb') as f:
+                entry['content'] = f.read()
+        except (OSError, json.JSONDecodeError):
+            self.misses += 1
+            logging.info(f'Cache miss: {url}')
+            return None
+        entry['fresh'] = time.time() - entry['stored_at'] < self.ttl_seconds
+        if entry['fresh']:
+            self.hits += 1
+            self.bytes_saved += len(entry['content'])
+            os.utime(self.entry_path(url, '.body'))
+            logging.info(f'Cache hit: {url}')
+        return entry
+
+    def validators(self, entry):
+        headers = {}
+        if entry['headers'].get('etag'):
+            headers['If-None-Match'] = entry['headers']['etag']
+        if entry['headers'].get('last-modified'):
+            headers['If-Modified-Since'] = entry['headers']['last-modified']
+        if not headers:
+            logging.info(f"Cache expired, no validators: {entry['url']}")
+        return headers
+
+    def touch(self, url, entry):
+        # Called when the server answered 304 Not Modified
+        self.revalidated += 1
+        self.bytes_saved += len(entry['content'])
+        logging.info(f'Cache revalidated: {url}')
+        self.write_meta(url, {k: v for k, v in entry.items() if k not in ('content', 'fresh')}, stored_at=time.time())
+        os.utime(self.entry_path(url, '.body'))
+
+    def put(self, url, status_code, headers, content, final_url=None):
+        body_path = self.entry_path(url, '.body')
+        old_size = os.path.getsize(body_path) if os.path.exists(body_path) else None
+        if old_size is not None:
+            # An expired entry downloaded again, urls without an entry were
+            # already counted by get
+            self.misses += 1
+            logging.info(f'Cache miss (expired): {url}')
+        with open(body_path + '.tmp', 'wb') as f:
+            f.write(content)
+        os.replace(body_path + '.tmp', body_path)
+        entry = {
+            'url': url,
+            'final_url': str(final_url or url),
+            'status_code': status_code,
+            'headers': {k: headers[k] for k in kept_headers if k in headers}
+        }
+        self.write_meta(url, entry, stored_at=time.time())
+        self.size += len(content) - (old_size or 0)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def write_meta(self, url, entry, stored_at):
+        entry = dict(entry, stored_at=stored_at)
+        meta_path = self.entry_path(url, '.json')
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(entry, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def evict(self):
+        bodies = []
+        for name in os.listdir(self.path):
+            if name.endswith('.body'):
+                body_path = os.path.join(self.path, name)
+                try:
+                    stat = os.stat(body_path)
+                except OSError:
+                    continue
+                bodies.append((stat.st_mtime, stat.st_size, body_path))
+        self.size = sum(size for _, size, _ in bodies)
+        evicted = 0
+        for _, size, body_path in sorted(bodies):
+            if self.size <= self.max_bytes * 0.9:
+                break
+            for path in (body_path, body_path[:-len('.body')] + '.json'):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.size -= size
+            evicted += 1
+        logging.info(f'Cache evicted {evicted} entries, {self.size / 1024 / 1024:.1f} MB left.')
+
+    def log_report(self):
+        logging.info(f'HTTP cache | {self.hits} hits | {self.revalidated} revalidated | {self.misses} misses | '
+                     f'{self.bytes_saved / 1024 / 1024:.1f} MB not downloaded')
@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+class Metrics():
+    # Per-stage timings and counters of a scraper run. Timings are kept as
+    # count/total/max per stage name ('funda.page_load', 'flush.write', ...),
+    # counters as plain totals. Every observation is also appended to a JSON
+    # lines file when jsonl_path is set.
+
+    def __init__(self, jsonl_path=None):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.counters = {}
+        self.started = time.monotonic()
+        self.jsonl_path = jsonl_path
+        self.jsonl = None
+        if jsonl_path:
+            directory = os.path.dirname(jsonl_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.jsonl = open(jsonl_path, 'a')
+
+    def emit(self, record):
+        if self.jsonl is None:
+            return
+        record = dict(record, ts=datetime.now(timezone.utc).isoformat(), pid=os.getpid())
+        self.jsonl.write(json.dumps(record) + '\n')
+        self.jsonl.flush()
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            stats = self.stages.setdefault(stage, {'count': 0, 'total': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['total'] += seconds
+            stats['max'] = max(stats['max'], seconds)
+            self.emit({'type': 'timing', 'stage': stage, 'seconds': round(seconds, 4)})
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            self.emit({'type': 'counter', 'name': name, 'value': value})
+
+    def take(self):
+        # Returns what was recorded since the last take and starts over, used
+        # by shard workers to ship their metrics to the parent
+        with self.lock:
+            snapshot = {'stages': self.stages, 'counters': self.counters}
+            self.stages = {}
+            self.counters = {}
+        return snapshot
+
+    def merge(self, snapshot):
+        with self.lock:
+            for stage, other in snapshot['stages'].items():
+                stats = self.stages.setdefault(stage, {'count': 0, 'total': 0.0, 'max': 0.0})
+                stats['count'] += other['count']
+                stats['total'] += other['total']
+                stats['max'] = max(stats['max'], other['max'])
+            for name, value in snapshot['counters'].items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def derived(self):
+        elapsed = time.monotonic() - self.started
+        values = {'run_seconds': elapsed}
+        for site in ('pararius', 'funda'):
+            pages = self.counters.get(f'{site}.pages', 0)
+            if pages:
+                values[f'{site}.pages_per_minute'] = pages / (elapsed / 60) if elapsed else 0.0
+                values[f'{site}.listings_per_page'] = self.counters.get(f'{site}.listings', 0) / pages
+        return values
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        lines = [f"{'stage':<28}{'count':>8}{'total s':>10}{'mean s':>9}{'max s':>9}{'% run':>8}"]
+        for stage, stats in sorted(self.stages.items()):
+            mean = stats['total'] / stats['count'] if stats['count'] else 0.0
+            share = 100 * stats['total'] / elapsed if elapsed else 0.0
+            lines.append(f"{stage:<28}{stats['count']:>8}{stats['total']:>10.1f}{mean:>9.2f}{stats['max']:>9.2f}{share:>8.1f}")
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'{name:<28}{value:>8}')
+        for name, value in sorted(self.derived().items()):
+            lines.append(f'{name:<28}{value:>8.1f}')
+        return '\n'.join(lines)
+
+    def write_prometheus(self, path):
+        # Text exposition format for the node_exporter textfile collector. The
+        # file describes the last run, so everything is exported as a gauge.
+        families = [
+            ('scraper_stage_seconds', 'stage', {k: v['total'] for k, v in self.stages.items()}),
+            ('scraper_stage_calls', 'stage', {k: v['count'] for k, v in self.stages.items()}),
+            ('scraper_stage_seconds_max', 'stage', {k: v['max'] for k, v in self.stages.items()}),
+            ('scraper_events', 'name', self.counters),
+            ('scraper_run_value', 'name', self.derived()),
+        ]
+        lines = []
+        for metric, label, values in families:
+            lines.append(f'# TYPE {metric} gauge')
+            for key, value in sorted(values.items()):
+                lines.append(f'{metric}{{{label}="{key}"}} {value}')
+        lines.append('# TYPE scraper_last_run_timestamp_seconds gauge')
+        lines.append(f'scraper_last_run_timestamp_seconds {time.time():.0f}')
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path + '.tmp', 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(path + '.tmp', path)
+
+    def close(self, prometheus_path=None):
+        logging.info('Run metrics:\n' + self.summary())
+        self.emit({'type': 'summary', 'stages': self.stages, 'counters': self.counters, 'derived': self.derived()})
+        if prometheus_path:
+            self.write_prometheus(prometheus_path)
+        if self.jsonl is not None:
+            self.jsonl.close()
+            self.jsonl = None
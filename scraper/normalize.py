@@ -0,0 +1,143 @@
+import re
+import numpy as np
+import pandas as pd
+from parsing import process_price, price_range_pattern, property_columns
+
+# Turns the raw records of the parse_* functions into property rows, one
+# batch at a time with pandas string kernels:
+# - price: price text -> price, price_type (same results as process_price)
+# - Pararius location/title: page text -> cleaned text, postcode, property_type
+# - Pararius surface/rooms: page text -> numbers, surface_unit
+# - Funda postcode: '1234AB' -> '1234 AB', '/maand' price types -> 'per month'
+# Funda listings without a price are dropped, and price, surface, rooms and
+# bedrooms come out as nullable integers.
+
+non_digits = r'[^\d]'
+
+
+def text_column(series):
+    return series.astype(object).where(series.notna(), None).astype('string')
+
+
+def to_int(series):
+    return pd.to_numeric(series, errors='coerce').astype('Int64')
+
+
+def normalize_prices(price_text):
+    text = text_column(price_text).str.replace('€', '', regex=False).str.replace('\n', '', regex=False)
+    digits = text.str.replace(non_digits, '', regex=True)
+    price = pd.to_numeric(digits, errors='coerce').astype('Int64')
+    price_type = text.str.strip().str.split(' ').str[1:].str.join(' ').astype('string')
+    # Ranges are averaged and digits int() reads but to_numeric does not are
+    # rare enough to go through process_price itself
+    fallback = text.str.match(price_range_pattern.pattern).fillna(False).astype(bool)
+    fallback |= price.isna() & digits.str.len().fillna(0).gt(0)
+    if fallback.any():
+        results = text[fallback].astype(object).map(process_price)
+        price[fallback] = pd.array([r[0] for r in results], dtype='Int64')
+        price_type[fallback] = pd.array([r[1] for r in results], dtype='string')
+    price_type = price_type.where(price.notna(), pd.NA)
+    return price, price_type
+
+
+def normalize_batch(df):
+    df = df.copy()
+    pararius = df['page_source'].eq('Pararius').to_numpy()
+    funda = df['page_source'].eq('Funda').to_numpy()
+
+    price, price_type = normalize_prices(df['price'])
+    price_type = price_type.where(~funda, price_type.str.replace('/maand', 'per month', regex=False))
+
+    location = text_column(df['location'])
+    title = text_column(df['title'])
+    postcode = text_column(df['postcode'])
+    property_type = text_column(df['property_type'])
+    surface_unit = text_column(df['surface_unit'])
+    surface = df['surface'].astype(object)
+    rooms = df['rooms'].astype(object)
+    if pararius.any():
+        p_location = location[pararius].str.replace('\n', '', regex=False).str.strip()
+        p_title = title[pararius].str.replace('\n', '', regex=False).str.strip()
+        p_surface = text_column(df['surface'][pararius])
+        location[pararius] = p_location
+        title[pararius] = p_title
+        postcode[pararius] = p_location.str.split(' ').str[:2].str.join(' ')
+        property_type[pararius] = p_title.str.split(' ').str[0].str.strip()
+        surface_unit[pararius] = p_surface.str.split(' ').str[-1]
+        surface[pararius] = p_surface.str.replace(non_digits, '', regex=True).astype(object)
+        rooms[pararius] = text_column(df['rooms'][pararius]).str.replace(non_digits, '', regex=True).astype(object)
+    if funda.any():
+        f_postcode = postcode[funda]
+        postcode[funda] = f_postcode.str[:4] + ' ' + f_postcode.str[4:]
+
+    df['price'] = price
+    df['price_type'] = price_type
+    df['location'] = location
+    df['title'] = title
+    df['postcode'] = postcode
+    df['property_type'] = property_type
+    df['surface_unit'] = surface_unit
+    df['surface'] = to_int(surface)
+    df['rooms'] = to_int(rooms)
+    df['bedrooms'] = to_int(df['bedrooms'])
+    keep = ~(funda & (df['price'].isna() | df['price'].eq(0)).to_numpy())
+    return df.loc[keep, property_columns].reset_index(drop=True)
+
+
+def normalize_rows(df):
+    # Row by row reference with the per-listing code the parsers used to
+    # run, kept to check normalize_batch against and to benchmark it
+    rows = []
+    for record in df.to_dict('records'):
+        record = dict(record)
+        if record['page_source'] == 'Pararius':
+            if record['location'] is not None:
+                record['location'] = record['location'].replace('\n', '').strip()
+                record['postcode'] = ' '.join(record['location'].split(' ')[:2])
+            if record['title'] is not None:
+                record['title'] = record['title'].replace('\n','').strip()
+                record['property_type'] = record['title'].split(' ')[0].strip()
+            if record['price'] is not None:
+                record['price'], record['price_type'] = process_price(record['price'])
+            if record['surface'] is not None:
+                surface_text = record['surface']
+                record['surface'] = re.sub(non_digits, '', surface_text)
+                record['surface_unit'] = surface_text.split(' ')[-1]
+            if record['rooms'] is not None:
+                record['rooms'] = re.sub(non_digits, '', record['rooms'])
+        else:
+            if record['postcode'] is not None:
+                record['postcode'] = record['postcode'][:4] + ' ' + record['postcode'][4:]
+            record['price'], record['price_type'] = process_price(record['price'])
+            if record['price_type']:
+                record['price_type'] = record['price_type'].replace('/maand', 'per month')
+            if not record['price']:
+                continue
+        for column in ('price', 'surface', 'rooms', 'bedrooms'):
+            try:
+                record[column] = int(record[column])
+            except (TypeError, ValueError):
+                record[column] = None
+        rows.append(record)
+    return pd.DataFrame(rows, columns=property_columns)
+
+
+def fingerprints(df):
+    # Short hash of what can change on a listing while its url stays the same.
+    # Works on normalized batches and on rows read back from the property
+    # table alike, whatever integer/float/nullable dtypes those come in.
+    columns = pd.DataFrame({column: to_int(df[column]) for column in ('price', 'surface', 'rooms')}, index=df.index)
+    columns['status'] = text_column(df['status'])
+    # 64-bit hash of every row at once, written out as 16 hex characters
+    hashes = pd.util.hash_pandas_object(columns, index=False).to_numpy()
+    hexed = np.frombuffer(hashes.astype('>u8').tobytes().hex().encode('ascii'), dtype='S16').astype(str)
+    return pd.Series(hexed, index=df.index, dtype=object)
+
+
+def same_records(a, b):
+    # Compares two normalized batches, treating every kind of missing value alike
+    if len(a) != len(b):
+        return False
+    a = a.astype(object).where(a.notna(), None)
+    b = b.astype(object).where(b.notna(), None)
+    return a.to_dict('records') == b.to_dict('records')
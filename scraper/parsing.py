@@ -0,0 +1,229 @@
+from bs4 import BeautifulSoup
+from datetime import date
+import re
+import logging
+import sys
+
+property_columns = [
+    'page_source', 'scrape_date', 'post_type', 'city', 'location', 'postcode', 'title', 'property_type',
+    'price', 'price_type', 'surface', 'surface_unit', 'rooms', 'bedrooms', 'furnished', 'url', 'status'
+]
+
+
+# Listings without a single non-zero digit in their price can never get a
+# price, Funda cards like that are skipped while parsing
+has_price = re.compile(r'[1-9]')
+
+
+def empty_property_data():
+    # Parsers fill price, Pararius location/title/surface/rooms and the Funda
+    # postcode with the text found on the page, normalize.normalize_batch
+    # turns them into the values stored in the property table
+    return {column: [] for column in property_columns}
+
+
+def get_backend(name='bs4'):
+    # Extraction backends expose the same parse_* functions as this module
+    if name == 'bs4':
+        return sys.modules[__name__]
+    elif name == 'lxml':
+        import parsing_lxml
+        return parsing_lxml
+    raise ValueError(f'Unknown extraction backend: {name}')
+
+
+def parse_fragment(html):
+    return BeautifulSoup(html, 'html.parser')
+
+
+price_range_pattern = re.compile(r'.*\d[\d.,]*\s*-\s*\d[\d.,]*.*')
+
+
+def process_price(price_text):
+    try:
+        price_text = price_text.replace('€','').replace('\n','')
+        if bool(price_range_pattern.match(price_text)):
+            num1str = re.sub(r'[^\d]', '', price_text.split('-')[0])
+            num2str = re.sub(r'[^\d]', '', price_text.split('-')[1])
+            num1 = int(num1str)
+            num2 = int(num2str)
+            price = int((num1+num2)/2)
+            price_type = ' '.join(price_text.replace('.','')
+                                .replace(',','')
+                                .replace(num1str,'')
+                                .replace(num2str,'')
+                                .strip()
+                                .split(' ')[1:]).strip()
+        else:
+            price = int(re.sub(r'[^\d]', '', price_text))
+            price_type = ' '.join(price_text.strip().split(' ')[1:])
+        return price, price_type
+    except:
+        return None, None
+
+
+def parse_pararius_page(html, city, post_type, page):
+    # Returns (total_pages, finished, data) for one Pararius results page
+    soup = BeautifulSoup(html,'html.parser')
+    page_propts = soup.find_all('li', class_="search-list__item search-list__item--listing")
+    total_pages = None
+    if page == 1:
+        try:
+            pagination = soup.find_all('a', class_="pagination__link")
+            total_pages = int(pagination[-2].text)
+        except:
+            logging.info(f'No pages found.')
+            return None, True, None
+
+    if len(page_propts) == 0:
+        logging.info('Reached page with no properties.')
+        return None, True, None
+
+    data = empty_property_data()
+    for p in page_propts:
+        data['page_source'].append('Pararius')
+        data['scrape_date'].append(date.today())
+        data['city'].append(city.capitalize())
+        data['post_type'].append(post_type)
+        data['bedrooms'].append(None)
+        data['status'].append('Available')
+        data['postcode'].append(None)
+        data['property_type'].append(None)
+        data['price_type'].append(None)
+        data['surface_unit'].append(None)
+        pc = p.find('div',class_="listing-search-item__sub-title'")
+        data['location'].append(pc.get_text() if pc is not None else None)
+        t = p.find('a',class_='listing-search-item__link listing-search-item__link--title')
+        if t is not None:
+            data['title'].append(t.get_text())
+            data['url'].append('https://www.pararius.nl' + t.attrs['href'])
+        else:
+            data['title'].append(None)
+            data['url'].append(None)
+        pr = p.find('div',class_="listing-search-item__price")
+        data['price'].append(pr.get_text() if pr is not None else None)
+        sf = p.find('li',class_="illustrated-features__item illustrated-features__item--surface-area")
+        data['surface'].append(sf.get_text() if sf is not None else None)
+        rm = p.find('li',class_="illustrated-features__item illustrated-features__item--number-of-rooms")
+        data['rooms'].append(rm.get_text() if rm is not None else None)
+        fr = p.find('li',class_="illustrated-features__item illustrated-features__item--interior")
+        if fr is not None:
+            data['furnished'].append(p.find('li',class_="illustrated-features__item illustrated-features__item--interior").get_text())
+        else:
+            data['furnished'].append(None)
+
+    return total_pages, False, data
+
+
+def parse_funda_pagination(pagination_html):
+    soup = BeautifulSoup(pagination_html, 'html.parser')
+
+    page_numbers = []
+    for li in soup.find_all('li'):
+        a_tag = li.find('a')
+        if a_tag and a_tag.text.strip().isdigit():
+            page_numbers.append(int(a_tag.text.strip()))
+
+    return max(page_numbers) if page_numbers else 1
+
+
+def funda_page_listings(html):
+    return BeautifulSoup(html, 'html.parser').select('div.border-b.pb-3')
+
+
+def parse_funda_page(html, city, post_type, property_type, num_rooms, page):
+    # Offline counterpart of Scraper.scrape_funda_page for a saved page_source
+    soup = BeautifulSoup(html, 'html.parser')
+    total_pages = None
+    if page == 1:
+        pagination = soup.select_one('ul.my-5.flex.items-center')
+        total_pages = parse_funda_pagination(str(pagination)) if pagination else 1
+    listings = soup.select('div.border-b.pb-3')
+    if not listings:
+        return total_pages, True, None
+    return total_pages, False, parse_funda_listings(listings, city, post_type, property_type, num_rooms)
+
+
+def parse_funda_listings(listings, city, post_type, property_type, num_rooms):
+    # listings are BeautifulSoup elements, either from a page snapshot or
+    # from the innerHTML of a single listing
+    data = empty_property_data()
+    for soup in listings:
+        link_tag = soup.select_one('a[data-testid="listingDetailsAddress"]')
+        if link_tag:
+            title_span = link_tag.select_one('.flex.font-semibold span.truncate')
+            title = title_span.get_text(strip=True) if title_span else None
+
+            relative_url = link_tag.get('href', '').strip()
+            link = f"https://www.funda.nl{relative_url}" if relative_url else None
+        else:
+            title = None
+            link = None
+
+        address_meta = soup.select_one('a[data-testid="listingDetailsAddress"] div.truncate.text-neutral-80')
+        postcode = None
+        if address_meta:
+            address_text = address_meta.get_text(strip=True)
+            parts = address_text.split(None, 1)
+            if len(parts) == 2:
+                postcode = parts[0]
+            else:
+                postcode = address_text
+
+        price_section = soup.select_one('div.font-semibold.mt-2.mb-0 div.truncate')
+        if not price_section:
+            continue
+
+        raw_price_text = price_section.get_text(strip=True)
+        if not has_price.search(raw_price_text):
+            continue
+
+        surfaces = []
+        bedrooms = None
+
+        detail_spans = soup.select('ul.flex.h-8.flex-wrap.gap-4.overflow-hidden.truncate.py-1 li.flex.items-center span')
+        for span in detail_spans:
+            text = span.get_text(strip=True)
+            if text.endswith('m²'):
+                try:
+                    surfaces.append(int(text.split()[0]))
+                except ValueError:
+                    pass
+            elif text.isdigit():
+                try:
+                    if bedrooms is None:
+                        bedrooms = int(text)
+                except ValueError:
+                    pass
+
+        surface = max(surfaces) if surfaces else None
+
+        status_div = soup.select_one('div.absolute.left-2.top-1')
+        status = "Available"
+
+        if status_div:
+            tag_texts = [span.get_text(strip=True).lower() for span in status_div.find_all('span')]
+
+            if any("verkocht" in txt for txt in tag_texts):
+                status = "Unavailable"
+            elif any("onder bod" in txt for txt in tag_texts):
+                status = "In negotiations"
+
+        data['page_source'].append('Funda')
+        data['scrape_date'].append(date.today())
+        data['post_type'].append(post_type)
+        data['city'].append(city.capitalize() if city else 'Unknown')
+        data['location'].append(None)
+        data['postcode'].append(postcode)
+        data['title'].append(title)
+        data['property_type'].append(property_type)
+        data['price'].append(raw_price_text)
+        data['price_type'].append(None)
+        data['surface'].append(surface)
+        data['surface_unit'].append('m²')
+        data['rooms'].append(num_rooms)
+        data['bedrooms'].append(bedrooms)
+        data['furnished'].append(None)
+        data['url'].append(link)
+        data['status'].append(status)
+    return data
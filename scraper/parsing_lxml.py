@@ -0,0 +1,220 @@
+from datetime import date
+import logging
+import lxml.html
+from parsing import empty_property_data, has_price
+
+# XPath counterpart of parsing.py. Selectors mirror the BeautifulSoup ones:
+# class_="a b" matches the exact class attribute, single classes and CSS
+# class chains match on class tokens.
+
+html_parser = lxml.html.HTMLParser(encoding='utf-8')
+
+
+def cls(*names):
+    return ''.join(f"[contains(concat(' ', normalize-space(@class), ' '), ' {name} ')]" for name in names)
+
+
+pararius_listing_xpath = './/li[@class="search-list__item search-list__item--listing"]'
+pararius_pagination_xpath = f'.//a{cls("pagination__link")}'
+# The class name below really ends in a quote, as in parsing.py
+pararius_location_xpath = """.//div[contains(concat(" ", normalize-space(@class), " "), " listing-search-item__sub-title' ")]"""
+pararius_title_xpath = './/a[@class="listing-search-item__link listing-search-item__link--title"]'
+pararius_price_xpath = f'.//div{cls("listing-search-item__price")}'
+pararius_surface_xpath = './/li[@class="illustrated-features__item illustrated-features__item--surface-area"]'
+pararius_rooms_xpath = './/li[@class="illustrated-features__item illustrated-features__item--number-of-rooms"]'
+pararius_interior_xpath = './/li[@class="illustrated-features__item illustrated-features__item--interior"]'
+
+funda_listing_xpath = f'.//div{cls("border-b", "pb-3")}'
+funda_pagination_xpath = f'.//ul{cls("my-5", "flex", "items-center")}'
+funda_link_xpath = './/a[@data-testid="listingDetailsAddress"]'
+# Descendant combinators are written as ancestor:: predicates, so like
+# soupsieve the ancestor may sit above the element the search starts from.
+funda_title_xpath = f'.//span{cls("truncate")}[ancestor::*{cls("flex", "font-semibold")}]'
+funda_address_xpath = (f'.//div{cls("truncate", "text-neutral-80")}'
+                       f'[ancestor::a[@data-testid="listingDetailsAddress"]]')
+funda_price_xpath = f'.//div{cls("truncate")}[ancestor::div{cls("font-semibold", "mt-2", "mb-0")}]'
+funda_details_xpath = (f'.//span[ancestor::li{cls("flex", "items-center")}'
+                       f'[ancestor::ul{cls("flex", "h-8", "flex-wrap", "gap-4", "overflow-hidden", "truncate", "py-1")}]]')
+funda_status_xpath = f'.//div{cls("absolute", "left-2", "top-1")}'
+
+
+def parse_document(html):
+    return lxml.html.document_fromstring(html.encode('utf-8'), parser=html_parser)
+
+
+def parse_fragment(html):
+    return lxml.html.fragment_fromstring(html, create_parent='div')
+
+
+def first(element, xpath):
+    found = element.xpath(xpath)
+    return found[0] if found else None
+
+
+def get_text(element, strip=False):
+    texts = element.xpath('.//text()')
+    if strip:
+        return ''.join(t.strip() for t in texts if t.strip())
+    return ''.join(texts)
+
+
+def parse_pararius_page(html, city, post_type, page):
+    # Returns (total_pages, finished, data) for one Pararius results page
+    root = parse_document(html)
+    page_propts = root.xpath(pararius_listing_xpath)
+    total_pages = None
+    if page == 1:
+        try:
+            pagination = root.xpath(pararius_pagination_xpath)
+            total_pages = int(get_text(pagination[-2]))
+        except:
+            logging.info(f'No pages found.')
+            return None, True, None
+
+    if len(page_propts) == 0:
+        logging.info('Reached page with no properties.')
+        return None, True, None
+
+    data = empty_property_data()
+    for p in page_propts:
+        data['page_source'].append('Pararius')
+        data['scrape_date'].append(date.today())
+        data['city'].append(city.capitalize())
+        data['post_type'].append(post_type)
+        data['bedrooms'].append(None)
+        data['status'].append('Available')
+        data['postcode'].append(None)
+        data['property_type'].append(None)
+        data['price_type'].append(None)
+        data['surface_unit'].append(None)
+        pc = first(p, pararius_location_xpath)
+        data['location'].append(get_text(pc) if pc is not None else None)
+        t = first(p, pararius_title_xpath)
+        if t is not None:
+            data['title'].append(get_text(t))
+            data['url'].append('https://www.pararius.nl' + t.get('href'))
+        else:
+            data['title'].append(None)
+            data['url'].append(None)
+        pr = first(p, pararius_price_xpath)
+        data['price'].append(get_text(pr) if pr is not None else None)
+        sf = first(p, pararius_surface_xpath)
+        data['surface'].append(get_text(sf) if sf is not None else None)
+        rm = first(p, pararius_rooms_xpath)
+        data['rooms'].append(get_text(rm) if rm is not None else None)
+        fr = first(p, pararius_interior_xpath)
+        if fr is not None:
+            data['furnished'].append(get_text(fr))
+        else:
+            data['furnished'].append(None)
+
+    return total_pages, False, data
+
+
+def funda_page_numbers(root):
+    page_numbers = []
+    for li in root.xpath('.//li'):
+        a_tag = first(li, './/a')
+        if a_tag is not None and get_text(a_tag).strip().isdigit():
+            page_numbers.append(int(get_text(a_tag).strip()))
+    return max(page_numbers) if page_numbers else 1
+
+
+def parse_funda_pagination(pagination_html):
+    return funda_page_numbers(parse_fragment(pagination_html))
+
+
+def funda_page_listings(html):
+    return parse_document(html).xpath(funda_listing_xpath)
+
+
+def parse_funda_page(html, city, post_type, property_type, num_rooms, page):
+    # Offline counterpart of Scraper.scrape_funda_page for a saved page_source
+    root = parse_document(html)
+    total_pages = None
+    if page == 1:
+        pagination = first(root, funda_pagination_xpath)
+        total_pages = funda_page_numbers(pagination) if pagination is not None else 1
+    listings = root.xpath(funda_listing_xpath)
+    if not listings:
+        return total_pages, True, None
+    return total_pages, False, parse_funda_listings(listings, city, post_type, property_type, num_rooms)
+
+
+def parse_funda_listings(listings, city, post_type, property_type, num_rooms):
+    data = empty_property_data()
+    for listing in listings:
+        link_tag = first(listing, funda_link_xpath)
+        if link_tag is not None:
+            title_span = first(link_tag, funda_title_xpath)
+            title = get_text(title_span, strip=True) if title_span is not None else None
+
+            relative_url = link_tag.get('href', '').strip()
+            link = f"https://www.funda.nl{relative_url}" if relative_url else None
+        else:
+            title = None
+            link = None
+
+        address_meta = first(listing, funda_address_xpath)
+        postcode = None
+        if address_meta is not None:
+            address_text = get_text(address_meta, strip=True)
+            parts = address_text.split(None, 1)
+            if len(parts) == 2:
+                postcode = parts[0]
+            else:
+                postcode = address_text
+
+        price_section = first(listing, funda_price_xpath)
+        if price_section is None:
+            continue
+
+        raw_price_text = get_text(price_section, strip=True)
+        if not has_price.search(raw_price_text):
+            continue
+
+        surfaces = []
+        bedrooms = None
+        for span in listing.xpath(funda_details_xpath):
+            text = get_text(span, strip=True)
+            if text.endswith('m²'):
+                try:
+                    surfaces.append(int(text.split()[0]))
+                except ValueError:
+                    pass
+            elif text.isdigit():
+                try:
+                    if bedrooms is None:
+                        bedrooms = int(text)
+                except ValueError:
+                    pass
+
+        surface = max(surfaces) if surfaces else None
+
+        status_div = first(listing, funda_status_xpath)
+        status = "Available"
+        if status_div is not None:
+            tag_texts = [get_text(span, strip=True).lower() for span in status_div.xpath('.//span')]
+            if any("verkocht" in txt for txt in tag_texts):
+                status = "Unavailable"
+            elif any("onder bod" in txt for txt in tag_texts):
+                status = "In negotiations"
+
+        data['page_source'].append('Funda')
+        data['scrape_date'].append(date.today())
+        data['post_type'].append(post_type)
+        data['city'].append(city.capitalize() if city else 'Unknown')
+        data['location'].append(None)
+        data['postcode'].append(postcode)
+        data['title'].append(title)
+        data['property_type'].append(property_type)
+        data['price'].append(raw_price_text)
+        data['price_type'].append(None)
+        data['surface'].append(surface)
+        data['surface_unit'].append('m²')
+        data['rooms'].append(num_rooms)
+        data['bedrooms'].append(bedrooms)
+        data['furnished'].append(None)
+        data['url'].append(link)
+        data['status'].append(status)
+    return data
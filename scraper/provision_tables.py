@@ -0,0 +1,168 @@
+import argparse
+import json
+import logging
+import os
+from datetime import date, timedelta
+import pandas as pd
+from storage import get_storage, load_schema
+from normalize import fingerprints
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+with open('config/bigquery_config.json', 'r') as f:
+    bigquery_config = json.load(f)
+with open('config/storage_config.json', 'r') as f:
+    storage_config = json.load(f)
+
+# Partition column (a DATE) and clustering columns per table. The columns
+# themselves come from schemas/<table>.json; tables without an entry get
+# neither.
+table_layouts = {
+    'property': {'partition': 'first_scrape_date', 'cluster': ['status', 'last_scrape_date', 'postcode', 'url']},
+    'property_history': {'partition': 'change_date', 'cluster': ['url', 'post_type']},
+    'property_duplicate_cluster': {'partition': 'detected_date', 'cluster': ['url']},
+    'postcode_gwb': {'cluster': ['postcode']},
+    'stats': {'cluster': ['region_resolution', 'post_type', 'property_type', 'value']},
+    'stats_sketch': {'cluster': ['buurt', 'post_type', 'property_type', 'value']},
+    'geodata_gemeente': {'cluster': ['gemeente_code']},
+    'geodata_stadsdeel': {'cluster': ['stadsdeel']},
+    'geodata_stadsdeel_onderverdeling': {'cluster': ['stadsdeel_onderverdeling']},
+    'geodata_wijk': {'cluster': ['wijk_code']},
+    'geodata_buurt': {'cluster': ['buurt_code']},
+}
+
+
+def pipeline_queries(storage):
+    # The queries the services run against these tables, as they run them
+    today = date.today()
+    return {
+        'scraper: status sweep': f"""
+            UPDATE {storage.table('property')}
+            SET status = 'Unavailable'
+            WHERE status = 'Available' AND last_scrape_date < DATE '{today}'
+        """,
+        'scraper: load fingerprints': f"""
+            SELECT url, post_type, price, surface, rooms, status FROM {storage.table('property')}
+            WHERE status != 'Unavailable'
+        """,
+        'scraper: dedup new listings': f"""
+            SELECT url, post_type, page_source, postcode, price, rooms, property_type, title
+            FROM {storage.table('property')}
+            WHERE first_scrape_date >= DATE '{today - timedelta(days=1)}'
+            OR url IN (
+                SELECT url FROM {storage.table('property_history')}
+                WHERE change_date >= DATE '{today - timedelta(days=1)}' AND change_type IN ('new', 'changed')
+            )
+        """,
+        'statistics: changed listings': f"""
+            SELECT p.*, q.*
+            FROM {storage.table('property')} p
+            LEFT JOIN {storage.table('postcode_gwb')} q
+            ON p.postcode = q.postcode
+            WHERE p.first_scrape_date >= DATE '{today - timedelta(days=1)}'
+            OR p.url IN (
+                SELECT url FROM {storage.table('property_history')} WHERE change_date >= DATE '{today - timedelta(days=1)}'
+            )
+            OR p.url IN (
+                SELECT url FROM {storage.table('property_duplicate_cluster')}
+                WHERE detected_date >= DATE '{today - timedelta(days=1)}'
+            )
+        """,
+        'statistics: fetch_data': f"""
+            SELECT p.*, q.*
+            FROM {storage.table('property')} p
+            LEFT JOIN {storage.table('postcode_gwb')} q
+            ON p.postcode = q.postcode
+        """,
+        'app: stats for a map': f"""
+            SELECT s.stadsdeel, s.mode, s.number_of_properties, g.geometry
+            FROM {storage.table('stats')} s
+            LEFT JOIN {storage.table('geodata_stadsdeel')} g
+            ON s.stadsdeel = g.stadsdeel
+            WHERE region_resolution = 'stadsdeel' AND post_type = 'Rent'
+            AND property_type = 'Apartment' AND value = 'price'
+        """,
+    }
+
+
+def scanned_bytes(storage):
+    scanned = {}
+    for name, sql in pipeline_queries(storage).items():
+        try:
+            scanned[name] = storage.dry_run_bytes(sql)
+        except Exception as e:
+            logging.info(f'Dry run of {name} failed: {e}')
+            scanned[name] = None
+    return scanned
+
+
+def provision(storage, schemas_dir, tables=None):
+    results = []
+    for file_name in sorted(os.listdir(schemas_dir)):
+        table = file_name[:-len('.json')]
+        if not file_name.endswith('.json') or (tables and table not in tables):
+            continue
+        layout = table_layouts.get(table, {})
+        done = storage.provision(table, load_schema(os.path.join(schemas_dir, file_name)),
+                                 partition=layout.get('partition'), cluster=layout.get('cluster', []))
+        logging.info(f'{table}: {done}.')
+        results.append({'table': table, 'partition': layout.get('partition'),
+                        'cluster': ', '.join(layout.get('cluster', [])), 'result': done})
+    return pd.DataFrame(results)
+
+
+def recompute_history_fingerprints(storage, schemas_dir):
+    # property_history rows written before fingerprints were hashed with
+    # hash_pandas_object hold the old hashes. A hash only depends on the
+    # listing's content, so each old value maps to exactly one new one, which
+    # also converts previous_fingerprint. Running it twice changes nothing.
+    history = storage.query(f"SELECT * FROM {storage.table('property_history')}")
+    if len(history) == 0:
+        return 0
+    stored = history['fingerprint'].notna()
+    recomputed = fingerprints(history)
+    new_hashes = dict(zip(history.loc[stored, 'fingerprint'], recomputed[stored]))
+    history['previous_fingerprint'] = history['previous_fingerprint'].map(new_hashes)
+    history.loc[stored, 'fingerprint'] = recomputed[stored]
+    storage.truncate_write(history, 'property_history',
+                           schema=load_schema(os.path.join(schemas_dir, 'property_history.json')))
+    return int(stored.sum())
+
+
+def megabytes(value):
+    return None if value is None else round(value / 1024 / 1024, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create or migrate the tables in schemas/ with their partitioning and clustering.')
+    parser.add_argument('--tables', nargs='+', help='Only these tables.')
+    parser.add_argument('--plan', action='store_true', help='Only print the layouts and the bytes the queries scan now.')
+    parser.add_argument('--recompute-fingerprints', action='store_true',
+                        help='Rewrite the fingerprints in property_history with the current hash, then exit.')
+    args = parser.parse_args()
+
+    storage = get_storage(storage_config, bigquery_config)
+    schemas_dir = storage_config.get('schemas_dir', '../schemas')
+    if args.recompute_fingerprints:
+        logging.info(f'Recomputed {recompute_history_fingerprints(storage, schemas_dir)} property_history fingerprints.')
+        return
+    before = scanned_bytes(storage)
+    if args.plan:
+        layouts = pd.DataFrame([{'table': t, 'partition': l.get('partition'), 'cluster': ', '.join(l.get('cluster', []))}
+                                for t, l in table_layouts.items()])
+        print(layouts.to_string(index=False))
+        print(pd.DataFrame({'query': list(before), 'MB scanned': [megabytes(v) for v in before.values()]}).to_string(index=False))
+        return
+    print(provision(storage, schemas_dir, args.tables).to_string(index=False))
+    after = scanned_bytes(storage)
+    # Dry runs do not account for clustering, the bytes a query really bills
+    # on a clustered table are at most these
+    print(pd.DataFrame({
+        'query': list(before),
+        'MB before': [megabytes(v) for v in before.values()],
+        'MB after': [megabytes(after[k]) for k in before]
+    }).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
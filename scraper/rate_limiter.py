@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+
+class HostRateLimiter():
+    # Token bucket per host, kept as the time the next token becomes free.
+    # Callers ask for a slot right before a request and only wait for what is
+    # left of the interval, so parsing and flushing the previous page happen
+    # inside the politeness delay instead of before it.
+    #
+    # The interval adapts to the responses: throttling (429), server errors
+    # and failed connections double it up to max_interval, every success
+    # shrinks it by 10% back towards the configured interval.
+
+    def __init__(self, interval=6.0, burst=1, max_interval=120.0):
+        self.interval = interval
+        self.burst = burst
+        self.max_interval = max_interval
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def host_state(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = {
+                'interval': self.interval,
+                'next_time': time.monotonic(),
+                'requests': 0,
+                'throttled': 0,
+                'errors': 0,
+                'waited': 0.0
+            }
+        return self.hosts[host]
+
+    def reserve(self, url):
+        # Takes the next slot for the host and returns how long to wait for it
+        host = urlparse(url).netloc
+        with self.lock:
+            state = self.host_state(host)
+            now = time.monotonic()
+            start = max(now, state['next_time'] - (self.burst - 1) * state['interval'])
+            state['next_time'] = max(state['next_time'], now) + state['interval']
+            delay = start - now
+            state['requests'] += 1
+            state['waited'] += delay
+        return delay
+
+    def wait(self, url):
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_async(self, url):
+        delay = self.reserve(url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def record(self, url, status_code=None, error=False, retry_after=None):
+        host = urlparse(url).netloc
+        with self.lock:
+            state = self.host_state(host)
+            if error or status_code == 429 or (status_code is not None and status_code >= 500):
+                if status_code == 429:
+                    state['throttled'] += 1
+                else:
+                    state['errors'] += 1
+                state['interval'] = min(self.max_interval, state['interval'] * 2)
+                if retry_after:
+                    state['next_time'] = max(state['next_time'], time.monotonic() + retry_after)
+            else:
+                state['interval'] = max(self.interval, state['interval'] * 0.9)
+
+    def record_response(self, url, response):
+        retry_after = response.headers.get('Retry-After')
+        retry_after = int(retry_after) if retry_after and retry_after.isdigit() else None
+        self.record(url, status_code=response.status_code, retry_after=retry_after)
+
+    def log_report(self):
+        with self.lock:
+            for host, state in sorted(self.hosts.items()):
+                logging.info(f"Rate limiter | {host} | {state['requests']} requests | {state['throttled']} throttled | "
+                             f"{state['errors']} errors | waited {state['waited']:.1f}s | "
+                             f"interval {state['interval']:.1f}s")
@@ -0,0 +1,36 @@
+import pandas as pd
+
+
+class RecordBuffer():
+    # Append-only column store for scraped listings. Pages are appended by
+    # extending one list per column, so adding a page costs O(page) instead of
+    # copying everything collected so far. The DataFrame is only built when a
+    # batch is taken out for flushing.
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.clear()
+
+    def __len__(self):
+        return self.rows
+
+    def append(self, data):
+        rows = len(data[self.columns[0]])
+        if any(len(data[column]) != rows for column in self.columns):
+            raise ValueError('All columns of a page must have the same length.')
+        for column in self.columns:
+            self.data[column].extend(data[column])
+        self.rows += rows
+
+    def to_dataframe(self):
+        return pd.DataFrame(self.data, columns=self.columns)
+
+    def take(self):
+        # Returns the buffered rows as a DataFrame and empties the buffer
+        df = self.to_dataframe()
+        self.clear()
+        return df
+
+    def clear(self):
+        self.data = {column: [] for column in self.columns}
+        self.rows = 0
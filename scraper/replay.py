@@ -0,0 +1,171 @@
+import argparse
+import logging
+import sys
+import time
+import pandas as pd
+from html_archive import iter_archive
+from parsing import get_backend
+from normalize import normalize_batch, normalize_rows, same_records
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def extract_record(record, parser):
+    params = record['params']
+    if record['source'] == 'pararius':
+        return parser.parse_pararius_page(record['html'], params['city'], params['post_type'], params['page'])
+    elif record['source'] == 'funda':
+        return parser.parse_funda_page(record['html'], params['city'], params['post_type'], params['property_type'],
+                                       params['num_rooms'], params['page'])
+    raise ValueError(f"Unknown source: {record['source']}")
+
+
+def replay(archive_path, source=None, backend='bs4'):
+    parser = get_backend(backend)
+    frames = []
+    for record in iter_archive(archive_path, source):
+        _, _, data = extract_record(record, parser)
+        if data is not None:
+            frames.append(pd.DataFrame(data))
+    if not frames:
+        return pd.DataFrame()
+    return normalize_batch(pd.concat(frames).reset_index(drop=True))
+
+
+def time_extraction(records, parser, repeat):
+    listings = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for record in records:
+            _, _, data = extract_record(record, parser)
+            if data is not None:
+                listings += len(data['url'])
+    return time.perf_counter() - start, listings // repeat
+
+
+def benchmark(archive_path, source=None, repeat=3, backend='bs4'):
+    # Pages are decompressed up front so only the extraction is timed
+    parser = get_backend(backend)
+    records = list(iter_archive(archive_path, source))
+    results = []
+    for src in sorted(set(r['source'] for r in records)):
+        src_records = [r for r in records if r['source'] == src]
+        elapsed, listings = time_extraction(src_records, parser, repeat)
+        results.append({
+            'source': src,
+            'backend': backend,
+            'pages': len(src_records),
+            'listings': listings,
+            'seconds': elapsed / repeat,
+            'pages_per_s': len(src_records) * repeat / elapsed if elapsed else None,
+            'listings_per_s': listings * repeat / elapsed if elapsed else None
+        })
+    return pd.DataFrame(results)
+
+
+def compare_backends(archive_path, source=None, backends=('bs4', 'lxml'), repeat=3):
+    # Checks that every backend extracts the same records from every archived
+    # page, then times them side by side.
+    records = list(iter_archive(archive_path, source))
+    parsers = {name: get_backend(name) for name in backends}
+    mismatches = []
+    for record in records:
+        reference_name = backends[0]
+        reference = extract_record(record, parsers[reference_name])
+        for name in backends[1:]:
+            result = extract_record(record, parsers[name])
+            if result != reference:
+                mismatches.append({'source': record['source'], 'url': record['url'],
+                                   'fetched_at': record['fetched_at'], 'backend': name})
+    timings = pd.concat([benchmark(archive_path, source, repeat, name) for name in backends]).reset_index(drop=True)
+    return pd.DataFrame(mismatches), timings
+
+
+def benchmark_normalize(archive_path, source=None, repeat=3, scale=1, backend='bs4'):
+    # Extracts the raw records once, optionally repeated scale times to get
+    # batches of a realistic size, then times the vectorized normalization
+    # against the per-row reference and checks they agree.
+    parser = get_backend(backend)
+    frames = []
+    for record in iter_archive(archive_path, source):
+        _, _, data = extract_record(record, parser)
+        if data is not None:
+            frames.append(pd.DataFrame(data))
+    if not frames:
+        return pd.DataFrame(), True
+    raw = pd.concat(frames * scale).reset_index(drop=True)
+    results = []
+    outputs = {}
+    for name, normalize in (('per_row', normalize_rows), ('batch', normalize_batch)):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            outputs[name] = normalize(raw)
+        elapsed = (time.perf_counter() - start) / repeat
+        results.append({
+            'path': name,
+            'rows': len(raw),
+            'seconds': elapsed,
+            'rows_per_s': len(raw) / elapsed if elapsed else None
+        })
+    results = pd.DataFrame(results)
+    results['speedup'] = results['seconds'].iloc[0] / results['seconds']
+    return results, same_records(outputs['batch'], outputs['per_row'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-run listing extraction over an archive of fetched pages.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    replay_parser = subparsers.add_parser('replay', help='Extract listings from the archive.')
+    replay_parser.add_argument('archive', help='Archive directory or segment file.')
+    replay_parser.add_argument('--source', choices=['pararius', 'funda'])
+    replay_parser.add_argument('--output', help='Write the extracted listings to this CSV file.')
+    replay_parser.add_argument('--backend', choices=['bs4', 'lxml'], default='bs4')
+
+    bench_parser = subparsers.add_parser('benchmark', help='Report extraction throughput per source.')
+    bench_parser.add_argument('archive', help='Archive directory or segment file.')
+    bench_parser.add_argument('--source', choices=['pararius', 'funda'])
+    bench_parser.add_argument('--repeat', type=int, default=3)
+    bench_parser.add_argument('--backend', choices=['bs4', 'lxml'], default='bs4')
+
+    compare_parser = subparsers.add_parser('compare-backends', help='Check record parity and timing of the extraction backends.')
+    compare_parser.add_argument('archive', help='Archive directory or segment file.')
+    compare_parser.add_argument('--source', choices=['pararius', 'funda'])
+    compare_parser.add_argument('--repeat', type=int, default=3)
+
+    normalize_parser = subparsers.add_parser('benchmark-normalize', help='Time batch normalization against the per-row path.')
+    normalize_parser.add_argument('archive', help='Archive directory or segment file.')
+    normalize_parser.add_argument('--source', choices=['pararius', 'funda'])
+    normalize_parser.add_argument('--repeat', type=int, default=3)
+    normalize_parser.add_argument('--scale', type=int, default=1, help='Repeat the extracted records this many times.')
+    normalize_parser.add_argument('--backend', choices=['bs4', 'lxml'], default='bs4')
+
+    args = parser.parse_args()
+    if args.command == 'replay':
+        df = replay(args.archive, args.source, args.backend)
+        logging.info(f'Extracted {len(df)} listings.')
+        if args.output:
+            df.to_csv(args.output, index=False)
+        else:
+            print(df)
+    elif args.command == 'benchmark':
+        print(benchmark(args.archive, args.source, args.repeat, args.backend).to_string(index=False))
+    elif args.command == 'compare-backends':
+        mismatches, timings = compare_backends(args.archive, args.source, repeat=args.repeat)
+        print(timings.to_string(index=False))
+        if len(mismatches) > 0:
+            print(mismatches.to_string(index=False))
+            logging.error(f'{len(mismatches)} pages extracted differently by the backends.')
+            sys.exit(1)
+        logging.info('All backends extracted identical records.')
+    elif args.command == 'benchmark-normalize':
+        timings, identical = benchmark_normalize(args.archive, args.source, args.repeat, args.scale, args.backend)
+        print(timings.to_string(index=False))
+        if not identical:
+            logging.error('Batch normalization differs from the per-row path.')
+            sys.exit(1)
+        logging.info('Batch and per-row normalization produced identical records.')
+
+
+if __name__ == "__main__":
+    main()
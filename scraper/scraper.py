@@ -1,24 +1,30 @@
 import httpx
 import json
-from bs4 import BeautifulSoup
 import random
 import time
-import pandas as pd
 from datetime import date, datetime
-import re
 import chardet
 import logging
-from selenium.webdriver.chrome.options import Options
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import NoSuchElementException
-from google.cloud import bigquery
 from zoneinfo import ZoneInfo
+from async_crawler import ParariusAsyncCrawler
+from driver_pool import DriverPool
+from html_archive import HtmlArchive
+from parsing import process_price, get_backend, property_columns
+from record_buffer import RecordBuffer
+from flush_pipeline import FlushWorker
+from storage import get_storage
+from checkpoint import Checkpoint, search_key
+from sharded import run_sharded
+from rate_limiter import HostRateLimiter
+from http_cache import HttpCache
+from metrics import Metrics
+from normalize import normalize_batch, fingerprints
+import copy
 import time
-import gc
 import sys
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -27,532 +33,757 @@ max_tries = 5
 
 with open('config/bigquery_config.json', 'r') as f:
     bigquery_config = json.load(f)
+with open('config/storage_config.json', 'r') as f:
+    storage_config = json.load(f)
+
+# Layout of the batches loaded next to the property table before merging
+tmp_property_schema = {
+    "page_source": "STRING",
+    "scrape_date": "DATE",
+    "post_type": "STRING",
+    "city": "STRING",
+    "location": "STRING",
+    "postcode": "STRING",
+    "title": "STRING",
+    "property_type": "STRING",
+    "price": "INTEGER",
+    "price_type": "STRING",
+    "surface": "INTEGER",
+    "surface_unit": "STRING",
+    "rooms": "INTEGER",
+    "bedrooms": "INTEGER",
+    "furnished": "STRING",
+    "url": "STRING",
+    "status": "STRING"
+}
+
+# One row per new or changed listing, see update_property_table
+property_history_schema = {
+    "url": "STRING",
+    "post_type": "STRING",
+    "change_date": "DATE",
+    "change_type": "STRING",
+    "price": "INTEGER",
+    "price_type": "STRING",
+    "surface": "INTEGER",
+    "rooms": "INTEGER",
+    "status": "STRING",
+    "fingerprint": "STRING",
+    "previous_fingerprint": "STRING"
+}
+
+# Columns a changed listing gets overwritten with, the rest keeps its first seen value
+property_update_columns = ['location', 'postcode', 'title', 'property_type', 'price', 'price_type', 'surface',
+                           'surface_unit', 'rooms', 'bedrooms', 'furnished', 'status']
+
+# pipeline_state entry with the date of the last completed full sweep
+full_sweep_state = 'scraper_full_sweep'
 
 class Scraper():
 
-    def __init__(self):
-        self.properties = pd.DataFrame()
+    def __init__(self, storage=None):
+        self.storage = storage if storage is not None else get_storage(storage_config, bigquery_config)
+        self.buffer = RecordBuffer(property_columns)
+        self.driver_pool = None
+        self.funda_snapshot_parsing = True
+        self.archive = None
+        self.parser = get_backend('bs4')
+        self.known_listings = None
+        self.fingerprints = {}
+        self.removed_duplicates = set()
+        self.full_sweep = True
+        self.completed = False
+        self.flusher = None
+        self.flush_rows = 500
+        self.flush_seconds = 300
+        self.last_flush_time = time.monotonic()
+        self.frontier = {}
+        self.pending_pages = {}
+        self.checkpoint = None
+        self.sink = None
+        self.scrape_unavailable = False
+        self.pararius_max_concurrency = 1
+        self.funda_room_planner = 'fixed'
+        self.funda_max_rooms = 15
+        self.added_rows = 0
+        self.rate_limiter = HostRateLimiter()
+        self.http_cache = None
+        self.metrics = Metrics()
         
     def reset_property_table(self):
-        del self.properties
-        gc.collect()
-        self.properties = pd.DataFrame()
-        logging.info(f'Property DataFrame has been reset.')
+        self.buffer.clear()
+        logging.info(f'Property buffer has been reset.')
         
     def process_price(self, price_text):
-        try:
-            pattern = r'.*\d[\d.,]*\s*-\s*\d[\d.,]*.*' # price range pattern
-            price_text = price_text.replace('€','').replace('\n','')
-            if bool(re.match(pattern, price_text)):
-                num1str = re.sub(r'[^\d]', '', price_text.split('-')[0])
-                num2str = re.sub(r'[^\d]', '', price_text.split('-')[1])
-                num1 = int(num1str)
-                num2 = int(num2str)
-                price = int((num1+num2)/2)
-                price_type = ' '.join(price_text.replace('.','')
-                                    .replace(',','')
-                                    .replace(num1str,'')
-                                    .replace(num2str,'')
-                                    .strip()
-                                    .split(' ')[1:]).strip()
-            else:
-                price = int(re.sub(r'[^\d]', '', price_text))
-                price_type = ' '.join(price_text.strip().split(' ')[1:])
-            return price, price_type
-        except:
-            return None, None
-    
+        return process_price(price_text)
 
-    def scrape_pararius(self, city, post_type, property_type, page):
+    def pararius_url(self, city, post_type, property_type, page):
         if post_type == 'Rent' and property_type == 'House':
-            return None, True
+            return None
         if post_type == 'Buy':
             if property_type == 'Apartment':
                 typ = 'appartement'
             elif property_type == 'House':
                 typ = 'huis'
-            base_url = f'https://www.pararius.nl/koopwoningen/{city}/{typ}/page-{page}'
+            return f'https://www.pararius.nl/koopwoningen/{city}/{typ}/page-{page}'
         elif post_type == 'Rent':
-            base_url = f'https://www.pararius.com/apartments/{city}/page-{page}'
-     
+            return f'https://www.pararius.com/apartments/{city}/page-{page}'
+
+    def fetch_pararius(self, base_url, page):
+        cached = self.http_cache.get(base_url) if self.http_cache is not None else None
+        if cached is not None and cached['fresh']:
+            self.metrics.count('pararius.cache_hits')
+            return self.cached_response(cached)
+        validators = self.http_cache.validators(cached) if cached is not None else {}
         tries = 0
         err = None
         while tries <= max_tries:
             headers = self.generate_headers()
+            headers.update(validators)
+            with self.metrics.timer('pararius.rate_limit_wait'):
+                self.rate_limiter.wait(base_url)
             try:
-                response = httpx.get(base_url, headers=headers, follow_redirects=True)
+                with self.metrics.timer('pararius.fetch'):
+                    response = httpx.get(base_url, headers=headers, follow_redirects=True)
             except httpx.TimeoutException as errt:
                 logging.info('Timeout Error, retrying...')
+                self.rate_limiter.record(base_url, error=True)
+                self.metrics.count('pararius.retries')
                 err = errt
                 tries += 1
-                time.sleep(1 + 10*random.random())
                 continue
             except httpx.ConnectError as errc:
                 logging.info('Connection Error, retrying...')
+                self.rate_limiter.record(base_url, error=True)
+                self.metrics.count('pararius.retries')
                 err = errc
                 tries += 1
-                time.sleep(1 + 10*random.random())
                 continue
-            if page != 1 and response.url == base_url[:-1]:
-                logging.info('Redirected, trying again')
-                tries += 1
-                time.sleep(1 + 10*random.random())
-                continue
-            if str(response.status_code)[0] == '2':
-                detected_encoding = chardet.detect(response.content)
-                if detected_encoding['encoding'] == None:
-                    logging.info('Response is corrupted')
-                    tries += 1
-                    time.sleep(1 + 10*random.random())
-                    continue
-                break
-            else:
-                tries += 1
-                time.sleep(1 + 10*random.random())
-        if tries == max_tries:
-            if err is None:
-                logging.info('Exceded number of tries.')
-                return None, True
-            else:
-                logging.info(f'Tries exceeded with error: {err}')
-                return None, True
-            
-        response.encoding = 'utf-8' 
-        soup = BeautifulSoup(response.text,'html.parser')
-        page_propts = soup.find_all('li', class_="search-list__item search-list__item--listing")
-        total_pages = None
-        if page == 1:
-            try:
-                pagination = soup.find_all('a', class_="pagination__link")
-                total_pages = int(pagination[-2].text)
-            except:
-                logging.info(f'No pages found.')
-                return None, True
-
-        if len(page_propts) != 0:
-            data = {'page_source': [],
-                    'scrape_date': [],
-                    'post_type': [],
-                    'city': [],
-                    'location': [],
-                    'postcode': [],
-                    'title': [],
-                    'property_type': [],
-                    'price': [],
-                    'price_type': [],
-                    'surface': [],
-                    'surface_unit': [],
-                    'rooms': [],
-                    'bedrooms': [],
-                    'furnished': [],
-                    'url': [],
-                    'status': []
-                }
-            for p in page_propts:
-                data['page_source'].append('Pararius')
-                data['scrape_date'].append(date.today())
-                data['city'].append(city.capitalize())
-                data['post_type'].append(post_type)
-                data['bedrooms'].append(None)
-                data['status'].append('Available')
-                pc = p.find('div',class_="listing-search-item__sub-title'")
-                if pc is not None:
-                    data['location'].append(pc.get_text().replace('\n', '').strip())
-                    data['postcode'].append(' '.join(pc.get_text().replace('\n', '').strip().split(' ')[:2]))
-                else:
-                    data['location'].append(None)
-                    data['postcode'].append(None)
-                t = p.find('a',class_='listing-search-item__link listing-search-item__link--title')
-                if t is not None:
-                    data['title'].append(t.get_text().replace('\n','').strip())
-                    data['property_type'].append(t.get_text().replace('\n','').strip().split(' ')[0].strip())
-                    data['url'].append('https://www.pararius.nl' + t.attrs['href'])
-                else:
-                    data['title'].append(None)
-                    data['property_type'].append(None)
-                    data['url'].append(None)
-                pr = p.find('div',class_="listing-search-item__price")
-                if pr is not None:
-                    try:
-                        price, price_type = self.process_price(pr.get_text())
-                        data['price'].append(price)
-                        data['price_type'].append(price_type)
-                    except Exception as e:
-                        logging.info(e)
-                        data['price'].append(None)
-                        data['price_type'].append(None)
-                else:
-                    data['price'].append(None)
-                    data['price_type'].append(None)
-                sf = p.find('li',class_="illustrated-features__item illustrated-features__item--surface-area")
-                if sf is not None:
-                    data['surface'].append(re.sub(r'[^\d]', '', sf.get_text()))
-                    data['surface_unit'].append(sf.get_text().split(' ')[-1])
-                else:
-                    data['surface'].append(None)
-                rm = p.find('li',class_="illustrated-features__item illustrated-features__item--number-of-rooms")
-                if rm is not None:
-                    data['rooms'].append(re.sub(r'[^\d]', '', rm.get_text()))
-                else:
-                    data['rooms'].append(None)
-                fr = p.find('li',class_="illustrated-features__item illustrated-features__item--interior")
-                if fr is not None:
-                    data['furnished'].append(p.find('li',class_="illustrated-features__item illustrated-features__item--interior").get_text())
-                else:
-                    data['furnished'].append(None)
-
-            df = pd.DataFrame(data)
-            if len(df) != 0:
-                self.properties = pd.concat([self.properties,df]).reset_index(drop=True)
-            time.sleep(1 + 10*random.random())
-            if total_pages:
-                return total_pages, False
-            else:
-                return None, False
+            self.rate_limiter.record_response(base_url, response)
+            if response.status_code == 304 and cached is not None:
+                self.http_cache.touch(base_url, cached)
+                self.metrics.count('pararius.cache_revalidated')
+                return self.cached_response(cached)
+            if self.pararius_response_ok(response, base_url, page):
+                if self.http_cache is not None:
+                    self.http_cache.put(base_url, response.status_code, response.headers, response.content, response.url)
+                return response
+            self.metrics.count('pararius.retries')
+            tries += 1
+        if err is None:
+            logging.info('Exceded number of tries.')
         else:
-            logging.info('Reached page with no properties.')
+            logging.info(f'Tries exceeded with error: {err}')
+        return None
+
+    def cached_response(self, entry):
+        # Rebuilt with the final url so redirect checks see the original response
+        return httpx.Response(entry['status_code'], headers=entry['headers'], content=entry['content'],
+                              request=httpx.Request('GET', entry['final_url']))
+
+    def pararius_response_ok(self, response, base_url, page):
+        if page != 1 and response.url == base_url[:-1]:
+            logging.info('Redirected, trying again')
+            return False
+        if str(response.status_code)[0] == '2':
+            detected_encoding = chardet.detect(response.content)
+            if detected_encoding['encoding'] == None:
+                logging.info('Response is corrupted')
+                return False
+            return True
+        return False
+
+    def scrape_pararius(self, city, post_type, property_type, page):
+        base_url = self.pararius_url(city, post_type, property_type, page)
+        if base_url is None:
             return None, True
-                
-    def scrape_funda(self, city, post_type, property_type, num_rooms, page, scrape_unavailable=False):
-        if property_type == 'House' and num_rooms == 1:
+        response = self.fetch_pararius(base_url, page)
+        if response is None:
             return None, True
+        response.encoding = 'utf-8'
+        if self.archive is not None:
+            self.archive.write('pararius', base_url, response.text, city=city, post_type=post_type,
+                               property_type=property_type, page=page)
+        return self.parse_pararius(response.text, city, post_type, page)
+
+    def parse_pararius(self, html, city, post_type, page):
+        with self.metrics.timer('pararius.parse'):
+            total_pages, finished, data = self.parser.parse_pararius_page(html, city, post_type, page)
+        self.metrics.count('pararius.pages')
+        if data is not None:
+            self.metrics.count('pararius.listings', len(data['url']))
+            self.add_properties(data)
+        return total_pages, finished
+
+    def add_properties(self, data):
+        self.buffer.append(data)
+        self.added_rows += len(data['url'])
+
+    def only_known_listings(self, data):
+        # True when every listing on the page was already in the property table
+        # before this run started
+        if self.known_listings is None or len(data['url']) == 0:
+            return False
+        return all(key in self.known_listings for key in zip(data['url'], data['post_type']))
+
+    def load_fingerprints(self):
+        # Fingerprints are computed from the stored columns rather than kept in
+        # the table, so they stay right when run_scraper marks listings unavailable.
+        # Unavailable listings are most of the table and are skipped: one that
+        # comes back has no previous fingerprint and is upserted as new.
+        df = self.storage.query(f"""
+            SELECT url, post_type, price, surface, rooms, status FROM {self.storage.table('property')}
+            WHERE status != 'Unavailable'
+        """)
+        self.fingerprints = dict(zip(zip(df['url'], df['post_type']), fingerprints(df))) if len(df) else {}
+        logging.info(f'{len(self.fingerprints)} listing fingerprints loaded.')
+
+    def load_removed_duplicates(self):
+        # Pararius listings dedup.py deleted as copies of a Funda listing. They
+        # are still on Pararius, without this they would be inserted (and
+        # deleted) again every day.
+        try:
+            df = self.storage.query(f"""
+                SELECT DISTINCT url, post_type FROM {self.storage.table('property_duplicate_cluster')}
+                WHERE NOT keep
+            """)
+        except Exception as e:
+            logging.info(f'Could not load removed duplicates: {e}')
+            return
+        self.removed_duplicates = set(zip(df['url'], df['post_type']))
+        logging.info(f'{len(self.removed_duplicates)} removed duplicates will be skipped.')
+
+    def load_known_listings(self):
+        self.known_listings = set(self.fingerprints)
+        logging.info(f'Incremental crawl: {len(self.known_listings)} known listings loaded.')
+
+    def funda_url(self, city, post_type, property_type, min_rooms, max_rooms, page, scrape_unavailable=False):
         if post_type == 'Rent':
-            base_url = f'https://www.funda.nl/zoeken/huur?selected_area=["{city}"]&object_type=["{property_type.lower()}"]&rooms="{num_rooms}-{num_rooms}"'
+            base_url = f'https://www.funda.nl/zoeken/huur?selected_area=["{city}"]&object_type=["{property_type.lower()}"]&rooms="{min_rooms}-{max_rooms}"'
         elif post_type == 'Buy':
-            base_url = f'https://www.funda.nl/zoeken/koop?selected_area=["{city}"]&object_type=["{property_type.lower()}"]&rooms="{num_rooms}-{num_rooms}"'
+            base_url = f'https://www.funda.nl/zoeken/koop?selected_area=["{city}"]&object_type=["{property_type.lower()}"]&rooms="{min_rooms}-{max_rooms}"'
         if scrape_unavailable:
             base_url += '&availability=["available","negotiations","unavailable"]'
+        if self.known_listings is not None:
+            base_url += '&sort="date_down"' # newest first
         base_url += f'&search_result={page}'
+        return base_url
+
+    def scrape_funda(self, city, post_type, property_type, num_rooms, page, scrape_unavailable=False):
+        if property_type == 'House' and num_rooms == 1:
+            return None, True
+        base_url = self.funda_url(city, post_type, property_type, num_rooms, num_rooms, page, scrape_unavailable)
 
-        options = webdriver.ChromeOptions()
-        options = Options()
-        options.add_argument("--headless")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--window-size=1920,1080")
-        options.add_argument("--start-maximized")
-        options.add_argument("--disable-blink-features=AutomationControlled")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
-        user_agent = self.generate_headers(only_user_agent=True)
-        options.add_argument(f"user-agent={user_agent}")
-
-        service = Service('/usr/local/bin/chromedriver')
-        driver = webdriver.Chrome(service=service, options=options)
-        driver = webdriver.Chrome(options=options)
+        driver = self.get_driver_pool().acquire()
+        try:
+            total_pages, finished, retry = self.scrape_funda_page(driver, base_url, city, post_type, property_type, num_rooms, page)
+        except Exception:
+            self.driver_pool.release(driver, crashed=True)
+            raise
+        self.driver_pool.release(driver)
+        if retry:
+            self.metrics.count('funda.retries')
+            return self.scrape_funda(city, post_type, property_type, num_rooms, page, scrape_unavailable)
+        return total_pages, finished
+
+    def scrape_funda_page(self, driver, base_url, city, post_type, property_type, num_rooms, page):
         tries = 0
         err = None
         total_pages = None
         while tries <= max_tries:
             try:
                 logging.info(f'URL: {base_url}')
-                driver.get(base_url)
-                driver.set_page_load_timeout(60)
-                driver.execute_script("return document.readyState == 'complete'")
-                time.sleep(5)
-                
-                try:
-                    cookie_accept_button = WebDriverWait(driver, 10).until(
-                        EC.element_to_be_clickable((By.ID, "didomi-notice-agree-button"))
-                    )
-                    cookie_accept_button.click()
-                    print("Cookies accepted.")
-                except Exception as e:
-                    print("Cookie banner not found or already handled.", e)
+                with self.metrics.timer('funda.rate_limit_wait'):
+                    self.rate_limiter.wait(base_url)
+                with self.metrics.timer('funda.page_load'):
+                    driver.get(base_url)
+                self.rate_limiter.record(base_url)
+                self.wait_for_funda_results(driver)
                 
-                if page == 1:
+                with self.metrics.timer('funda.cookie_wait'):
                     try:
-                        pagination = WebDriverWait(driver, 45).until(
-                            EC.presence_of_element_located((By.CSS_SELECTOR, 'ul.my-5.flex.items-center'))
+                        cookie_accept_button = WebDriverWait(driver, 10).until(
+                            EC.element_to_be_clickable((By.ID, "didomi-notice-agree-button"))
                         )
-                        pagination_html = pagination.get_attribute('innerHTML')
-                        soup = BeautifulSoup(pagination_html, 'html.parser')
-
-                        page_numbers = []
-                        for li in soup.find_all('li'):
-                            a_tag = li.find('a')
-                            if a_tag and a_tag.text.strip().isdigit():
-                                page_numbers.append(int(a_tag.text.strip()))
-
-                        total_pages = max(page_numbers) if page_numbers else 1
-                        print(f"Total pages: {total_pages}")
-                    except:
-                        total_pages = 1
+                        cookie_accept_button.click()
+                        print("Cookies accepted.")
+                    except Exception as e:
+                        print("Cookie banner not found or already handled.", e)
+                
+                with self.metrics.timer('funda.snapshot'):
+                    if self.funda_snapshot_parsing:
+                        # One page_source round-trip and a single parse for the whole results page
+                        page_html = driver.page_source
+                        listings = self.parser.funda_page_listings(page_html)
+                    else:
+                        page_html = None
+                        listings = driver.find_elements(By.CSS_SELECTOR, 'div.border-b.pb-3')
+
+                # Empty searches never render the pagination, so only wait for
+                # it once the page has listings
+                if page == 1 and listings:
+                    with self.metrics.timer('funda.pagination_wait'):
+                        try:
+                            pagination = WebDriverWait(driver, 45).until(
+                                EC.presence_of_element_located((By.CSS_SELECTOR, 'ul.my-5.flex.items-center'))
+                            )
+                            pagination_html = pagination.get_attribute('innerHTML')
+                            total_pages = self.parser.parse_funda_pagination(pagination_html)
+                            print(f"Total pages: {total_pages}")
+                        except:
+                            total_pages = 1
                 break                
                 
             except httpx.TimeoutException as errt:
                 logging.info('Timeout Error, retrying...')
+                self.rate_limiter.record(base_url, error=True)
+                self.metrics.count('funda.retries')
                 err = errt
                 tries += 1
-                time.sleep(1 + 10*random.random())
                 continue
             except httpx.ConnectError as errc:
                 logging.info('Connection Error, retrying...')
+                self.rate_limiter.record(base_url, error=True)
+                self.metrics.count('funda.retries')
                 err = errc
                 tries += 1
-                time.sleep(1 + 10*random.random())
                 continue
         if tries == max_tries:
             if err is None:
                 logging.info('Exceded number of tries.')
-                return None, True
+                return None, True, False
             else:
                 logging.info(f'Tries exceeded with error: {err}')
-                return None, True
+                return None, True, False
         
         
-        listings = driver.find_elements(By.CSS_SELECTOR, 'div.border-b.pb-3')
+        self.metrics.count('funda.pages')
+        if self.archive is not None:
+            page_html = page_html or driver.page_source
+            self.archive.write('funda', base_url, page_html, city=city, post_type=post_type,
+                               property_type=property_type, num_rooms=num_rooms, page=page)
 
         if listings:
-            data = {
-                'page_source': [], 'scrape_date': [], 'post_type': [], 'city': [],
-                'location': [], 'postcode': [], 'title': [], 'property_type': [],
-                'price': [], 'price_type': [], 'surface': [], 'surface_unit': [],
-                'rooms': [], 'bedrooms': [], 'furnished': [], 'url': [], 'status': []
-            }
-
-            for listing in listings:
-                inner_html = listing.get_attribute('innerHTML')
-                soup = BeautifulSoup(inner_html, 'html.parser')
-
-                link_tag = soup.select_one('a[data-testid="listingDetailsAddress"]')
-                if link_tag:
-                    title_span = link_tag.select_one('.flex.font-semibold span.truncate')
-                    title = title_span.get_text(strip=True) if title_span else None
-
-                    relative_url = link_tag.get('href', '').strip()
-                    link = f"https://www.funda.nl{relative_url}" if relative_url else None
+            with self.metrics.timer('funda.parse'):
+                if self.funda_snapshot_parsing:
+                    soups = listings
                 else:
-                    title = None
-                    link = None
-
-                address_meta = soup.select_one('a[data-testid="listingDetailsAddress"] div.truncate.text-neutral-80')
-                postcode, city_name = None, None
-                if address_meta:
-                    address_text = address_meta.get_text(strip=True)
-                    parts = address_text.split(None, 1) 
-                    if len(parts) == 2:
-                        postcode = parts[0]
-                        city_name = parts[1]
-                    else:
-                        postcode = address_text
-                    postcode = postcode[:4] + ' ' + postcode[4:]
-
-                price_section = soup.select_one('div.font-semibold.mt-2.mb-0 div.truncate')
-                if not price_section:
-                    continue
-                
-                raw_price_text = price_section.get_text(strip=True)
-                price, price_type = self.process_price(raw_price_text)
-                if price_type:
-                    price_type = price_type.replace('/maand', 'per month')
-                if not price:
-                    continue
-                
-                surfaces = []
-                bedrooms = None
-                
-                detail_spans = soup.select('ul.flex.h-8.flex-wrap.gap-4.overflow-hidden.truncate.py-1 li.flex.items-center span')
-                for span in detail_spans:
-                    text = span.get_text(strip=True)
-                    if text.endswith('m²'):
-                        try:
-                            surfaces.append(int(text.split()[0]))
-                        except ValueError:
-                            pass
-                    elif text.isdigit():
-                        try:
-                            if bedrooms is None:
-                                bedrooms = int(text)
-                        except ValueError:
-                            pass
-                
-                surface = max(surfaces) if surfaces else None
-
-                status_div = soup.select_one('div.absolute.left-2.top-1')
-                status = "Available"
-
-                if status_div:
-                    tag_texts = [span.get_text(strip=True).lower() for span in status_div.find_all('span')]
-                    
-                    if any("verkocht" in txt for txt in tag_texts):
-                        status = "Unavailable"
-                    elif any("onder bod" in txt for txt in tag_texts):
-                        status = "In negotiations"
-        
-
-                # Append to data dictionary
-                data['page_source'].append('Funda')
-                data['scrape_date'].append(date.today())
-                data['post_type'].append(post_type)
-                data['city'].append(city.capitalize() if city else 'Unknown')
-                data['location'].append(None)
-                data['postcode'].append(postcode)
-                data['title'].append(title)
-                data['property_type'].append(property_type) 
-                data['price'].append(price)
-                data['price_type'].append(price_type)
-                data['surface'].append(surface)
-                data['surface_unit'].append('m²')
-                data['rooms'].append(num_rooms)
-                data['bedrooms'].append(bedrooms)
-                data['furnished'].append(None) 
-                data['url'].append(link)
-                data['status'].append(status)
-                                                
-            driver.quit()
-
-            df = pd.DataFrame(data)
-            if len(df) != 0:
-                self.properties = pd.concat([self.properties,df]).reset_index(drop=True)
-            time.sleep(1 + 10*random.random())
+                    soups = [self.parser.parse_fragment(listing.get_attribute('innerHTML')) for listing in listings]
+                data = self.parser.parse_funda_listings(soups, city, post_type, property_type, num_rooms)
+
+            self.metrics.count('funda.listings', len(data['url']))
+            self.add_properties(data)
+            if self.only_known_listings(data):
+                logging.info('Page only has known listings, stopping this search.')
+                return total_pages, True, False
             if total_pages:
-                return total_pages, False
+                return total_pages, False, False
             else:
-                return None, False
+                return None, False, False
         else:
             if page == 1:
-                return None, True
+                return None, True, False
             else:
-                if "Geen resultaten gevonden" in driver.page_source:
-                    return None, True
+                if "Geen resultaten gevonden" in (page_html or driver.page_source):
+                    return None, True, False
                 else:
-                    return self.scrape_funda(city, post_type, property_type, num_rooms, page, scrape_unavailable)
+                    return None, False, True
+
+    def wait_for_funda_results(self, driver, timeout=15):
+        # Returns as soon as the listings, or the empty-search message, have rendered
+        with self.metrics.timer('funda.results_wait'):
+            try:
+                WebDriverWait(driver, timeout).until(EC.any_of(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, 'div.border-b.pb-3')),
+                    EC.presence_of_element_located((By.XPATH, "//*[contains(text(), 'Geen resultaten gevonden')]"))
+                ))
+            except Exception:
+                logging.info('Funda results did not render in time.')
+
+    def funda_has_results(self, city, post_type, property_type, min_rooms, max_rooms):
+        # One page load to find out whether a room range has any listings
+        base_url = self.funda_url(city, post_type, property_type, min_rooms, max_rooms, 1, self.scrape_unavailable)
+        driver = self.get_driver_pool().acquire()
+        try:
+            logging.info(f'Probing URL: {base_url}')
+            with self.metrics.timer('funda.rate_limit_wait'):
+                self.rate_limiter.wait(base_url)
+            with self.metrics.timer('funda.probe_load'):
+                driver.get(base_url)
+            self.rate_limiter.record(base_url)
+            self.wait_for_funda_results(driver)
+            has_results = len(self.parser.funda_page_listings(driver.page_source)) > 0
+        except Exception:
+            self.driver_pool.release(driver, crashed=True)
+            raise
+        self.driver_pool.release(driver)
+        return has_results
+
+    def get_driver_pool(self):
+        if self.driver_pool is None:
+            self.driver_pool = DriverPool(lambda: self.generate_headers(only_user_agent=True), metrics=self.metrics)
+        return self.driver_pool
+
+    def run(self, cities, sites, post_types, property_types, scrape_unavailable=False, pararius_max_concurrency=1,
+            driver_pool_size=1, driver_max_pages=50, funda_snapshot_parsing=True, archive_path=None, extraction_backend='bs4',
+            flush_rows=500, flush_seconds=300, flush_queue_size=2, incremental=False, full_sweep_every_days=7,
+            checkpoint_path=None, checkpoint_max_age_hours=24, workers=1, funda_room_planner='fixed', funda_max_rooms=15,
+            request_interval=6.0, max_request_interval=120.0, http_cache_path=None, http_cache_ttl_hours=12,
+            http_cache_max_mb=500, metrics_jsonl_path=None, metrics_prometheus_path=None, skip_removed_duplicates=False):
+        # A process crawls Funda one page at a time, so it only ever checks out
+        # one driver; parallel Funda crawls come from workers
+        if driver_pool_size != 1:
+            raise ValueError(f'driver_pool_size must be 1 (got {driver_pool_size}), use workers to crawl in parallel')
+        self.metrics = Metrics(metrics_jsonl_path)
+        # Incremental runs stop paging sorted searches at known listings, so only
+        # a full sweep sees (and refreshes last_scrape_date of) every listing
+        self.full_sweep = not incremental or self.full_sweep_due(full_sweep_every_days)
+        with self.metrics.timer('run.load_fingerprints'):
+            self.load_fingerprints()
+        if skip_removed_duplicates:
+            self.load_removed_duplicates()
+        if self.full_sweep:
+            self.known_listings = None
+            logging.info('Running full sweep.')
+        else:
+            self.load_known_listings()
+        self.funda_room_planner = funda_room_planner
+        self.funda_max_rooms = funda_max_rooms
+        self.frontier = {}
+        self.pending_pages = {}
+        self.checkpoint = None
+        if checkpoint_path:
+            # Only the settings that decide which pages are crawled identify a run
+            search_config = {
+                'cities': cities, 'sites': sites, 'post_types': post_types, 'property_types': property_types,
+                'scrape_unavailable': scrape_unavailable, 'full_sweep': self.full_sweep
+            }
+            self.checkpoint = Checkpoint(checkpoint_path, search_config, max_age_hours=checkpoint_max_age_hours)
+            self.frontier = self.checkpoint.load()
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.last_flush_time = time.monotonic()
+        self.flusher = FlushWorker(self.update_property_table, max_queue_size=flush_queue_size,
+                                   on_flushed=self.save_checkpoint, metrics=self.metrics)
+        session = {
+            'scrape_unavailable': scrape_unavailable,
+            'pararius_max_concurrency': pararius_max_concurrency,
+            'driver_pool_size': driver_pool_size,
+            'driver_max_pages': driver_max_pages,
+            'funda_snapshot_parsing': funda_snapshot_parsing,
+            'archive_path': archive_path,
+            'extraction_backend': extraction_backend,
+            'flush_rows': flush_rows,
+            'flush_seconds': flush_seconds,
+            'known_listings': self.known_listings,
+            'funda_room_planner': funda_room_planner,
+            'funda_max_rooms': funda_max_rooms,
+            'request_interval': request_interval,
+            'max_request_interval': max_request_interval,
+            'http_cache_path': http_cache_path,
+            'http_cache_ttl_hours': http_cache_ttl_hours,
+            'http_cache_max_mb': http_cache_max_mb
+        }
+        completed = False
+        try:
+            if workers > 1:
+                # Workers limit their requests independently, spread the interval
+                # so the hosts see the same rate as from a single process
+                session['request_interval'] = request_interval * workers
+                session['metrics_jsonl_path'] = metrics_jsonl_path
+                run_sharded(self, self.plan_searches(cities, sites, post_types, property_types), workers, session)
+            else:
+                self.start_session(**session)
+                self.run_searches(cities, sites, post_types, property_types)
+            completed = True
+        finally:
+            # Whatever is still buffered is written before the run returns
+            self.flush()
+            with self.metrics.timer('flush.drain'):
+                self.flusher.close()
+            failed_batches = self.flusher.failed_batches
+            self.metrics.count('flush.failed_batches', failed_batches)
+            self.flusher = None
+            self.end_session()
+            self.metrics.close(metrics_prometheus_path)
+        # A finished run starts from scratch next time. When batches failed to
+        # write, the checkpoint still points at the last page that was written.
+        self.completed = completed and failed_batches == 0
+        if self.completed and self.checkpoint is not None:
+            self.checkpoint.clear()
+
+    def full_sweep_due(self, full_sweep_every_days):
+        # Counted from the last full sweep that completed, so a failed or
+        # skipped run does not push the next one back a whole cycle
+        last_sweep = self.storage.read_state(full_sweep_state)
+        if last_sweep is None:
+            return True
+        today = datetime.now(tz=ZoneInfo("Europe/Amsterdam")).date()
+        return (today - date.fromisoformat(last_sweep)).days >= full_sweep_every_days
+
+    def start_session(self, scrape_unavailable=False, pararius_max_concurrency=1, driver_pool_size=1, driver_max_pages=50,
+                      funda_snapshot_parsing=True, archive_path=None, extraction_backend='bs4', flush_rows=500,
+                      flush_seconds=300, known_listings=None, funda_room_planner='fixed', funda_max_rooms=15,
+                      request_interval=6.0, max_request_interval=120.0, http_cache_path=None, http_cache_ttl_hours=12,
+                      http_cache_max_mb=500):
+        # Crawl settings and resources, shared by Scraper.run and shard workers
+        self.scrape_unavailable = scrape_unavailable
+        self.funda_room_planner = funda_room_planner
+        self.funda_max_rooms = funda_max_rooms
+        self.pararius_max_concurrency = pararius_max_concurrency
+        self.funda_snapshot_parsing = funda_snapshot_parsing
+        self.rate_limiter = HostRateLimiter(request_interval, max_interval=max_request_interval)
+        if http_cache_path:
+            self.http_cache = HttpCache(http_cache_path, ttl_seconds=http_cache_ttl_hours*3600,
+                                        max_bytes=http_cache_max_mb*1024*1024)
+        self.parser = get_backend(extraction_backend)
+        self.known_listings = known_listings
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.last_flush_time = time.monotonic()
+        if archive_path:
+            self.archive = HtmlArchive(archive_path)
+        self.driver_pool = DriverPool(
+            lambda: self.generate_headers(only_user_agent=True),
+            size=driver_pool_size,
+            max_pages_per_driver=driver_max_pages,
+            metrics=self.metrics
+        )
 
-    def run(self, cities, sites, post_types, property_types, scrape_unavailable=False):
-        overall_page_counter = 0 
+    def end_session(self):
+        self.rate_limiter.log_report()
+        if self.http_cache is not None:
+            self.http_cache.log_report()
+            self.http_cache = None
+        if self.driver_pool is not None:
+            self.driver_pool.close()
+            self.driver_pool = None
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+
+    def plan_searches(self, cities, sites, post_types, property_types):
+        # A search is (site, post_type, property_type, city, num_rooms), in crawl order
+        searches = []
         for site in sites:
             for post_type in post_types:
                 for property_type in property_types:
                     for city in cities:
                         if site == 'pararius':
-                            logging.info(f'Running: {site} | {post_type} | {property_type} | {city}')
-                            page = 1
-                            total_pages = 100 # placeholder
-                            finished = False
-                            tries = 0
-                            while not finished and page <= total_pages:
-                                logging.info(f'Page {page}/{total_pages if page > 1 else ""}')
-                                try:
-                                    total_pgs, finished = self.scrape_pararius(city, post_type, property_type, page)
-                                except:
-                                    if tries < 5:
-                                        total_pgs, finished = None, False
-                                        logging.info(f'Scraping page {page} failed, retrying...')
-                                        tries += 1
-                                    else:
-                                        total_pgs, finished = None, True
-                                        logging.info(f'Scraping page {page} failed, continuing')
-                                        tries = 0
-                                logging.info(f'Length of dataframe: {len(self.properties)}')
-                                if total_pgs:
-                                    total_pages = total_pgs
-                                page += 1
-                                tries = 0
-                                if overall_page_counter >= 15:
-                                    self.update_bigquery_table()
-                                    overall_page_counter = 0
-                                else:
-                                    overall_page_counter += 1
-                        if site == 'funda':
-                            for num_rooms in [1,2,3,4,5,6,7,8,9,10,11,12,13,14,15]:
-                                logging.info(f'Running: {site} | {post_type} | {property_type} | {city} | Room filter: {num_rooms}')
-                                page = 1
-                                total_pages = 100 # placeholder
-                                finished = False
-                                tries = 0
-                                while not finished and page <= total_pages:
-                                    logging.info(f'Page {page}/{total_pages if page > 1 else ""}')
-                                    try:
-                                        total_pgs, finished = self.scrape_funda(city, post_type, property_type, num_rooms, page, scrape_unavailable)
-                                    except:
-                                        if tries < 5:
-                                            total_pgs, finished = None, False
-                                            logging.info(f'Scraping page {page} failed, retrying...')
-                                            tries += 1
-                                        else:
-                                            total_pgs, finished = None, True
-                                            logging.info(f'Scraping page {page} failed, continuing')
-                                            tries = 0
-                                    logging.info(f'Length of dataframe: {len(self.properties)}')
-                                    if total_pgs:
-                                        total_pages = total_pgs
-                                    page += 1
-                                    if overall_page_counter >= 15:
-                                        self.update_bigquery_table()
-                                        overall_page_counter = 0
-                                    else:
-                                        overall_page_counter += 1
-                            if len(self.properties) > 0:
-                                self.update_bigquery_table()
+                            searches.append(('pararius', post_type, property_type, city, None))
+                        if site == 'funda' and self.funda_room_planner == 'adaptive':
+                            searches.append(('funda', post_type, property_type, city, 'auto'))
+                        elif site == 'funda':
+                            for num_rooms in range(1, self.funda_max_rooms + 1):
+                                searches.append(('funda', post_type, property_type, city, num_rooms))
+        return searches
+
+    def run_searches(self, cities, sites, post_types, property_types):
+        searches = self.plan_searches(cities, sites, post_types, property_types)
+        for site in sites:
+            site_searches = [search for search in searches if search[0] == site]
+            if site == 'pararius' and self.pararius_max_concurrency > 1:
+                logging.info(f'Running: {site} | async crawl, {self.pararius_max_concurrency} concurrent pages per host')
+                ParariusAsyncCrawler(self, max_concurrency_per_host=self.pararius_max_concurrency).run(site_searches)
+                continue
+            for search in site_searches:
+                self.scrape_search(search)
 
-        
-    def update_bigquery_table(self):
-        self.properties = self.properties.drop_duplicates(subset=['url', 'post_type'])
+    def run_search(self, search):
+        if search[0] == 'pararius' and self.pararius_max_concurrency > 1:
+            ParariusAsyncCrawler(self, max_concurrency_per_host=self.pararius_max_concurrency).run([search])
+        else:
+            self.scrape_search(search)
+
+    def scrape_search(self, search):
+        # Returns whether the search found any listings
+        site, post_type, property_type, city, num_rooms = search
+        if num_rooms == 'auto':
+            return self.scrape_funda_rooms(search)
+        key = search_key(search)
+        state = self.frontier.get(key, {})
+        if state.get('done'):
+            logging.info(f'Skipping completed search: {key}')
+            return True
+        added_rows = self.added_rows
+        if site == 'pararius':
+            logging.info(f'Running: {site} | {post_type} | {property_type} | {city}')
+        else:
+            logging.info(f'Running: {site} | {post_type} | {property_type} | {city} | Room filter: {num_rooms}')
+        page = state.get('page', 0) + 1
+        total_pages = state.get('total_pages') or 100 # placeholder
+        if page > 1:
+            logging.info(f'Resuming at page {page}/{total_pages}')
+        finished = False
+        tries = 0
+        while not finished and page <= total_pages:
+            logging.info(f'Page {page}/{total_pages if page > 1 else ""}')
+            try:
+                if site == 'pararius':
+                    total_pgs, finished = self.scrape_pararius(city, post_type, property_type, page)
+                else:
+                    total_pgs, finished = self.scrape_funda(city, post_type, property_type, num_rooms, page, self.scrape_unavailable)
+            except:
+                if tries < 5:
+                    logging.info(f'Scraping page {page} failed, retrying...')
+                    tries += 1
+                    continue
+                logging.info(f'Scraping page {page} failed, continuing')
+                break
+            logging.info(f'Buffered listings: {len(self.buffer)}')
+            if total_pgs:
+                total_pages = total_pgs
+            self.mark_page_done(key, page, total_pages)
+            page += 1
+            tries = 0
+            self.maybe_flush()
+        self.mark_search_done(key)
+        return self.added_rows > added_rows or state.get('page', 0) > 0
+
+    def scrape_funda_rooms(self, search):
+        # Listings only get a room count from the room filter of their search,
+        # so every listing is still scraped under a single room count. Counts
+        # are walked upwards until one comes back empty, then the remaining
+        # range is probed as a whole and bisected only where it has results.
+        _, post_type, property_type, city, _ = search
+        key = search_key(search)
+        if self.frontier.get(key, {}).get('done'):
+            logging.info(f'Skipping completed search: {key}')
+            return True
+        found = False
+        num_rooms = 2 if property_type == 'House' else 1
+        while num_rooms <= self.funda_max_rooms:
+            has_results = self.scrape_search(('funda', post_type, property_type, city, num_rooms))
+            found = found or has_results
+            num_rooms += 1
+            if not has_results:
+                break
+        found = self.scrape_funda_room_range(post_type, property_type, city, num_rooms, self.funda_max_rooms) or found
+        self.mark_search_done(key)
+        return found
+
+    def scrape_funda_room_range(self, post_type, property_type, city, min_rooms, max_rooms):
+        if min_rooms > max_rooms:
+            return False
+        if min_rooms == max_rooms:
+            return self.scrape_search(('funda', post_type, property_type, city, min_rooms))
         try:
-            self.properties = self.properties.dropna(subset=['price', 'surface', 'rooms'])
-            self.properties['price'] = self.properties['price'].astype(int)
-            self.properties['surface'] = self.properties['surface'].astype(int)
-            self.properties['rooms'] = self.properties['rooms'].astype(int)
-        except:
-            return None
-        
-        client = bigquery.Client()
-        tmp_table_id = f"{bigquery_config['project_id']}.{bigquery_config['dataset_id']}.tmp_property"
-        property_table_id = f"{bigquery_config['project_id']}.{bigquery_config['dataset_id']}.property"
-        current_date = datetime.now(tz=ZoneInfo("Europe/Amsterdam")).strftime('%Y-%m-%d')
-
-        job_config = bigquery.LoadJobConfig(
-            schema=[
-                bigquery.SchemaField("page_source", "STRING"),
-                bigquery.SchemaField("scrape_date", "DATE"),
-                bigquery.SchemaField("post_type", "STRING"),
-                bigquery.SchemaField("city", "STRING"),
-                bigquery.SchemaField("location", "STRING"),
-                bigquery.SchemaField("postcode", "STRING"),
-                bigquery.SchemaField("title", "STRING"),
-                bigquery.SchemaField("property_type", "STRING"),
-                bigquery.SchemaField("price", "INTEGER"),
-                bigquery.SchemaField("price_type", "STRING"),
-                bigquery.SchemaField("surface", "INTEGER"),
-                bigquery.SchemaField("surface_unit", "STRING"),
-                bigquery.SchemaField("rooms", "INTEGER"),
-                bigquery.SchemaField("bedrooms", "INTEGER"),
-                bigquery.SchemaField("furnished", "STRING"),
-                bigquery.SchemaField("url", "STRING"),
-                bigquery.SchemaField("status", "STRING"),
-            ],
-            write_disposition="WRITE_TRUNCATE",
-        )
+            has_results = self.funda_has_results(city, post_type, property_type, min_rooms, max_rooms)
+        except Exception as e:
+            logging.info(f'Probing {min_rooms}-{max_rooms} rooms failed, splitting the range: {e}')
+            has_results = True
+        if not has_results:
+            logging.info(f'Funda | {post_type} | {property_type} | {city} | No listings with {min_rooms}-{max_rooms} rooms')
+            return False
+        mid = (min_rooms + max_rooms) // 2
+        found = self.scrape_funda_room_range(post_type, property_type, city, min_rooms, mid)
+        return self.scrape_funda_room_range(post_type, property_type, city, mid + 1, max_rooms) or found
+
+    def mark_page_done(self, key, page, total_pages=None):
+        # The frontier only advances over contiguous pages, so pages finished out
+        # of order by the async crawl wait until the pages before them are done
+        state = self.frontier.setdefault(key, {'page': 0, 'total_pages': None, 'done': False})
+        if total_pages:
+            state['total_pages'] = total_pages
+        pending = self.pending_pages.setdefault(key, set())
+        pending.add(page)
+        while state['page'] + 1 in pending:
+            pending.remove(state['page'] + 1)
+            state['page'] += 1
+
+    def mark_search_done(self, key):
+        state = self.frontier.setdefault(key, {'page': 0, 'total_pages': None, 'done': False})
+        state['done'] = True
+        self.pending_pages.pop(key, None)
+
+    def save_checkpoint(self, properties, frontier):
+        if self.checkpoint is None or frontier is None:
+            return
+        # After a failed write later frontiers would skip pages that never made
+        # it to the table, so the checkpoint stays at the last good batch
+        if self.flusher is not None and self.flusher.failed_batches > 0:
+            return
+        self.checkpoint.save(frontier, len(properties))
+
+    def maybe_flush(self):
+        if len(self.buffer) >= self.flush_rows or time.monotonic() - self.last_flush_time >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        self.last_flush_time = time.monotonic()
+        if len(self.buffer) == 0:
+            return
+        properties = self.buffer.take()
+        # Every page counted in the frontier has its listings in this batch or
+        # an earlier one, so the snapshot is safe to resume from once written
+        frontier = copy.deepcopy(self.frontier)
+        if self.sink is not None:
+            self.sink(properties, frontier)
+        elif self.flusher is not None:
+            self.flusher.submit(properties, frontier)
+        else:
+            self.update_property_table(properties)
+            self.save_checkpoint(properties, frontier)
+
+    def update_property_table(self, properties):
+        with self.metrics.timer('flush.normalize'):
+            properties = normalize_batch(properties)
+        properties = properties.drop_duplicates(subset=['url', 'post_type'])
+        properties = properties.dropna(subset=['price', 'surface', 'rooms'])
+        if self.removed_duplicates:
+            kept = [key not in self.removed_duplicates for key in zip(properties['url'], properties['post_type'])]
+            self.metrics.count('flush.removed_duplicates', len(kept) - sum(kept))
+            properties = properties[kept].copy()
+        properties['price'] = properties['price'].astype('int64')
+        properties['surface'] = properties['surface'].astype('int64')
+        properties['rooms'] = properties['rooms'].astype('int64')
 
-        load_job = client.load_table_from_dataframe(self.properties, tmp_table_id, job_config=job_config)
-        load_job.result()
-
-        query = f"""
-            MERGE `{property_table_id}` AS property
-            USING `{tmp_table_id}` AS tmp
-            ON property.url = tmp.url AND property.post_type = tmp.post_type
-            WHEN MATCHED THEN
-            UPDATE SET 
-                property.last_scrape_date = DATE("{current_date}"),
-                property.status = "Available"
-            WHEN NOT MATCHED THEN
-            INSERT (
-                page_source, post_type, city, location, postcode, title, property_type, price, price_type, 
-                surface, surface_unit, rooms, bedrooms, furnished, url, status, first_scrape_date, last_scrape_date
-            )
-            VALUES (
-                tmp.page_source, tmp.post_type, tmp.city, tmp.location, tmp.postcode, 
-                tmp.title, tmp.property_type, tmp.price, tmp.price_type, tmp.surface, tmp.surface_unit, tmp.rooms,
-                tmp.bedrooms, tmp.furnished, tmp.url, tmp.status, DATE("{current_date}"), DATE("{current_date}")
-            )
-        """
-        job = client.query(query)
-        job.result()
-
-        client.delete_table(tmp_table_id, not_found_ok=True)
-        logging.info(f'{property_table_id} UPDATED IN BIGQUERY')
-        
-        self.reset_property_table()
+        current_date = datetime.now(tz=ZoneInfo("Europe/Amsterdam")).strftime('%Y-%m-%d')
+        properties['fingerprint'] = fingerprints(properties).values
+        keys = list(zip(properties['url'], properties['post_type']))
+        properties['previous_fingerprint'] = [self.fingerprints.get(key) for key in keys]
+        unchanged = (properties['fingerprint'] == properties['previous_fingerprint']).to_numpy()
+        changed = properties[~unchanged]
+
+        # Listings seen before with the same content only need their last seen date
+        if unchanged.any():
+            with self.metrics.timer('flush.touch'):
+                self.storage.update_matching(
+                    properties[unchanged], 'property',
+                    keys=['url', 'post_type'],
+                    schema=tmp_property_schema,
+                    update_values={'last_scrape_date': f"DATE '{current_date}'"}
+                )
+
+        if len(changed) > 0:
+            with self.metrics.timer('flush.load_merge'):
+                self.storage.merge_upsert(
+                    changed[list(tmp_property_schema)], 'property',
+                    keys=['url', 'post_type'],
+                    schema=tmp_property_schema,
+                    insert_columns=[c for c in tmp_property_schema if c != 'scrape_date'],
+                    update_columns=property_update_columns,
+                    update_values={'last_scrape_date': f"DATE '{current_date}'"},
+                    insert_values={
+                        'first_scrape_date': f"DATE '{current_date}'",
+                        'last_scrape_date': f"DATE '{current_date}'"
+                    }
+                )
+            history = changed[[c for c in property_history_schema if c in changed.columns]].copy()
+            history['change_date'] = date.fromisoformat(current_date)
+            history['change_type'] = changed['previous_fingerprint'].isna().map({True: 'new', False: 'changed'}).values
+            with self.metrics.timer('flush.history'):
+                self.storage.load(history[list(property_history_schema)], 'property_history',
+                                  schema=property_history_schema)
+
+        self.fingerprints.update(zip(keys, properties['fingerprint']))
+        new_rows = int(changed['previous_fingerprint'].isna().sum())
+        self.metrics.count('flush.rows', len(properties))
+        self.metrics.count('flush.unchanged', int(unchanged.sum()))
+        self.metrics.count('flush.changed', len(changed) - new_rows)
+        self.metrics.count('flush.new', new_rows)
+        logging.info(f'Property table updated with {len(properties)} listings: {int(unchanged.sum())} unchanged, '
+                     f'{len(changed) - new_rows} changed, {new_rows} new.')
 
     def generate_headers(self, only_user_agent=False):
         user_agents = [
@@ -0,0 +1,89 @@
+import copy
+import logging
+import multiprocessing
+import queue
+from checkpoint import search_key
+
+
+def frontier_changes(resumed, frontier):
+    return {key: state for key, state in frontier.items() if resumed.get(key) != state}
+
+
+def shard_worker(work_queue, result_queue, options):
+    # Imported here so a spawned worker does not import the scraper twice
+    from scraper import Scraper
+    from metrics import Metrics
+    scraper = Scraper()
+    scraper.metrics = Metrics(options.pop('metrics_jsonl_path', None))
+    resumed = {}
+    scraper.sink = lambda properties, frontier: result_queue.put(
+        ('rows', properties.to_dict('list'), frontier_changes(resumed, frontier), None)
+    )
+    scraper.start_session(**options)
+    try:
+        while True:
+            item = work_queue.get()
+            if item is None:
+                return
+            # Adaptive Funda searches expand into per-room searches, so the worker
+            # gets the whole resumed frontier and only reports what it changed
+            search, resumed = item
+            scraper.frontier = copy.deepcopy(resumed)
+            scraper.pending_pages = {}
+            scraper.run_search(search)
+            data = scraper.buffer.take().to_dict('list') if len(scraper.buffer) > 0 else None
+            result_queue.put(('done', data, frontier_changes(resumed, scraper.frontier), scraper.metrics.take()))
+    finally:
+        scraper.end_session()
+        if scraper.metrics.jsonl is not None:
+            scraper.metrics.jsonl.close()
+
+
+def run_sharded(scraper, searches, workers, options):
+    # Every search is a work item. Worker processes each drive their own
+    # Scraper (and Chrome pool) and send their rows and frontier back, the
+    # parent buffers them and feeds its single flush worker.
+    context = multiprocessing.get_context('spawn')
+    work_queue = context.Queue()
+    result_queue = context.Queue()
+    resumed = copy.deepcopy(scraper.frontier)
+    pending = 0
+    for search in searches:
+        if scraper.frontier.get(search_key(search), {}).get('done'):
+            logging.info(f'Skipping completed search: {search_key(search)}')
+            continue
+        work_queue.put((search, resumed))
+        pending += 1
+    workers = max(1, min(workers, pending))
+    for _ in range(workers):
+        work_queue.put(None)
+    logging.info(f'Sharded crawl: {pending} searches over {workers} worker processes')
+
+    processes = [
+        context.Process(target=shard_worker, args=(work_queue, result_queue, options), name=f'shard-{i}')
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        while pending > 0:
+            try:
+                kind, data, frontier, metrics = result_queue.get(timeout=60)
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes):
+                    raise RuntimeError(f'Shard workers exited with {pending} searches unfinished')
+                continue
+            if data is not None:
+                scraper.buffer.append(data)
+            scraper.frontier.update(frontier)
+            if metrics is not None:
+                scraper.metrics.merge(metrics)
+            if kind == 'done':
+                pending -= 1
+                logging.info(f'Sharded crawl: {pending} searches left, buffered listings: {len(scraper.buffer)}')
+            scraper.maybe_flush()
+    finally:
+        for process in processes:
+            if pending > 0:
+                process.terminate()
+            process.join()
@@ -0,0 +1,36 @@
+import os
+from html_archive import iter_archive
+from parsing import get_backend
+from replay import compare_backends, extract_record
+
+fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def test_backends_extract_identical_records():
+    bs4_parser, lxml_parser = get_backend('bs4'), get_backend('lxml')
+    records = list(iter_archive(fixtures))
+    assert set(r['source'] for r in records) == {'pararius', 'funda'}
+    for record in records:
+        assert extract_record(record, lxml_parser) == extract_record(record, bs4_parser), record['url']
+
+
+def test_fixture_pages_are_parsed():
+    listings = {}
+    for record in iter_archive(fixtures):
+        total_pages, finished, data = extract_record(record, get_backend('bs4'))
+        if record['params']['page'] == 1:
+            assert not finished and total_pages is not None
+            listings[record['source']] = data
+        else:
+            assert finished and data is None
+    # The Pararius page keeps every listing item, the Funda page drops the
+    # card without a price and the advert without one
+    assert len(listings['pararius']['url']) == 4
+    assert len(listings['funda']['url']) == 4
+    assert listings['funda']['status'] == ['Available', 'In negotiations', 'Unavailable', 'Available']
+
+
+def test_compare_backends_reports_no_mismatches():
+    mismatches, timings = compare_backends(fixtures, repeat=1)
+    assert len(mismatches) == 0
+    assert set(timings['backend']) == {'bs4', 'lxml'}
@@ -0,0 +1,19 @@
+import os
+import pytest
+
+# Modules every service ships its own copy of, the scraper's copy is the
+# one that gets edited
+repo = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+shared_copies = [
+    ('scraper/storage.py', 'statistics/storage.py'),
+    ('scraper/storage.py', 'app/storage.py'),
+    ('scraper/http_cache.py', 'geometry/http_cache.py'),
+]
+
+
+@pytest.mark.parametrize('original, copy', shared_copies)
+def test_copies_are_in_sync(original, copy):
+    with open(os.path.join(repo, original), 'rb') as f:
+        expected = f.read()
+    with open(os.path.join(repo, copy), 'rb') as f:
+        assert f.read() == expected, f'{copy} differs from {original}, copy it over again'
@@ -1,24 +1,51 @@
-from google.cloud import bigquery
 import pandas as pd
 import numpy as np
 import json
+from datetime import date
+from storage import get_storage
+from stats_engine import compute_all_statistics, resolutions, stats_columns, metric_columns, stat_cells, cell_membership
+from rollup import listing_sketches, sketch_statistics, stats_sketch_schema, cell_keys
 
-def fetch_data(bigquery_config):
-    client = bigquery.Client()
+stats_schema = {
+    "region_resolution": "STRING",
+    "stadsdeel": "STRING",
+    "subdivision": "STRING",
+    "wijk": "STRING",
+    "wijk_code": "STRING",
+    "buurt": "STRING",
+    "buurt_code": "STRING",
+    "post_type": "STRING",
+    "property_type": "STRING",
+    "furnished": "STRING",
+    "value": "STRING",
+    "median": "FLOAT",
+    "q1": "FLOAT",
+    "q3": "FLOAT",
+    "mode": "FLOAT",
+    "geometric_mean": "FLOAT",
+    "geometric_std": "FLOAT",
+    "geometric_conf_int_95_low": "FLOAT",
+    "geometric_conf_int_95_upp": "FLOAT",
+    "geometric_conf_int_75_low": "FLOAT",
+    "geometric_conf_int_75_upp": "FLOAT",
+    "geometric_conf_int_50_low": "FLOAT",
+    "geometric_conf_int_50_upp": "FLOAT",
+    "number_of_properties": "INTEGER"
+}
 
+def fetch_data(storage, where=None):
     query = f"""
     SELECT 
     p.*,
     q.*
-    FROM `{bigquery_config['project_id']}.{bigquery_config['dataset_id']}.property` p
-    LEFT JOIN `{bigquery_config['project_id']}.{bigquery_config['dataset_id']}.postcode_gwb` q
+    FROM {storage.table('property')} p
+    LEFT JOIN {storage.table('postcode_gwb')} q
     ON p.postcode = q.postcode
     """
+    if where:
+        query += f"WHERE {where}"
 
-    query_job = client.query(query)
-    results = query_job.result() 
-
-    dataframe = results.to_dataframe()
+    dataframe = storage.query(query)
 
     return dataframe
 
@@ -198,64 +225,158 @@ def run_stats_computation(df, percentile_bounds, min_properties_to_compute_stats
                         stats_df = pd.concat([stats_df,s])
     return stats_df
 
-def upload_dataframe_to_bigquery(df, bigquery_config):
-    table_id = f"{bigquery_config['project_id']}.{bigquery_config['dataset_id']}.stats"
-    client = bigquery.Client()
+def upload_dataframe(df, storage):
+    storage.truncate_write(df, 'stats', schema=stats_schema)
+    print("Table stats updated successfully.")
+                        
+# Stats rows are identified by their labels, the metrics are what a refresh updates
+stats_keys = [c for c in stats_columns if c not in metric_columns and c != 'number_of_properties']
+# Column of a stats row holding the name of its region, per resolution
+region_name_columns = {'stadsdeel': 'stadsdeel', 'stadsdeel_onderverdeling': 'subdivision', 'wijk': 'wijk',
+                       'buurt': 'buurt'}
 
-    schema = [
-        bigquery.SchemaField("region_resolution", "STRING"),
-        bigquery.SchemaField("stadsdeel", "STRING"),
-        bigquery.SchemaField("subdivision", "STRING"),
-        bigquery.SchemaField("wijk", "STRING"),
-        bigquery.SchemaField("wijk_code", "STRING"),
-        bigquery.SchemaField("buurt", "STRING"),
-        bigquery.SchemaField("buurt_code", "STRING"),
-        bigquery.SchemaField("post_type", "STRING"),
-        bigquery.SchemaField("property_type", "STRING"),
-        bigquery.SchemaField("furnished", "STRING"),
-        bigquery.SchemaField("value", "STRING"),
-        bigquery.SchemaField("median", "FLOAT"),
-        bigquery.SchemaField("q1", "FLOAT"),
-        bigquery.SchemaField("q3", "FLOAT"),
-        bigquery.SchemaField("mode", "FLOAT"),
-        bigquery.SchemaField("geometric_mean", "FLOAT"),
-        bigquery.SchemaField("geometric_std", "FLOAT"),
-        bigquery.SchemaField("geometric_conf_int_95_low", "FLOAT"),
-        bigquery.SchemaField("geometric_conf_int_95_upp", "FLOAT"),
-        bigquery.SchemaField("geometric_conf_int_75_low", "FLOAT"),
-        bigquery.SchemaField("geometric_conf_int_75_upp", "FLOAT"),
-        bigquery.SchemaField("geometric_conf_int_50_low", "FLOAT"),
-        bigquery.SchemaField("geometric_conf_int_50_upp", "FLOAT"),
-        bigquery.SchemaField("number_of_properties", "INTEGER"),
-    ]
 
-    job_config = bigquery.LoadJobConfig(
-        schema=schema,
-        write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE
-    )
+def fetch_changed_listings(storage, watermark):
+    # Listings new since the watermark, changed or marked unavailable (per
+    # property_history), or in a duplicate cluster found since then, whose
+    # deleted members were in the same postcode. Stats do not depend on
+    # last_scrape_date, so listings that were only seen again are left out.
+    return fetch_data(storage, where=f"""
+        p.first_scrape_date >= DATE '{watermark}'
+        OR p.url IN (
+            SELECT url FROM {storage.table('property_history')} WHERE change_date >= DATE '{watermark}'
+        )
+        OR p.url IN (
+            SELECT url FROM {storage.table('property_duplicate_cluster')} WHERE detected_date >= DATE '{watermark}'
+        )
+    """)
+
+
+def affected_cells(df):
+    # (resolution, region, cell) of every cell the listings in df are in
+    cells = stat_cells()
+    rows, cells_of_rows = cell_membership(df, cells)
+    frames = [pd.DataFrame({'region_resolution': region_resolution, 'region': df[region_resolution].to_numpy()[rows],
+                            'cell': cells_of_rows})
+              for region_resolution in resolutions]
+    return pd.concat(frames).dropna(subset=['region']).drop_duplicates()
+
+
+def affected_rows(stats_df, affected):
+    cells = stat_cells()
+    cell_index = pd.Index(cell_keys(*[pd.Series([c[i] for c in cells], dtype=object) for i in range(3)]))
+    region = pd.Series(None, index=stats_df.index, dtype=object)
+    for region_resolution, column in region_name_columns.items():
+        at_resolution = stats_df['region_resolution'] == region_resolution
+        region[at_resolution] = stats_df.loc[at_resolution, column]
+    keys = pd.DataFrame({
+        'region_resolution': stats_df['region_resolution'],
+        'region': region,
+        'cell': cell_index.get_indexer(cell_keys(stats_df['post_type'], stats_df['property_type'],
+                                                 stats_df['furnished']))
+    })
+    matched = keys.merge(affected.assign(affected=True), on=['region_resolution', 'region', 'cell'], how='left')
+    return stats_df[matched['affected'].fillna(False).to_numpy()]
+
+
+def fetch_regions(storage, column, regions):
+    # Listings of the given regions (a postcode_gwb column), through a
+    # temporary table instead of a literal list in the query
+    tmp_table = f'tmp_stats_{column}'
+    storage.truncate_write(pd.DataFrame({column: regions}), tmp_table, schema={column: 'STRING'})
+    try:
+        return fetch_data(storage, where=f"q.{column} IN (SELECT {column} FROM {storage.table(tmp_table)})")
+    finally:
+        storage.drop(tmp_table)
+
+
+def refresh_statistics(storage, stats_config, watermark, percentile_bounds, min_properties_to_compute_stats):
+    # Recomputes the stats cells holding listings that changed since the
+    # watermark and upserts them. Regions that lost all their listings keep
+    # their rows until the next full refresh.
+    changed = process_data(fetch_changed_listings(storage, watermark))
+    if changed.empty:
+        print(f'No listings changed since {watermark}.')
+        return
+    affected = affected_cells(changed)
+    buurten = changed['buurt'].dropna().unique().tolist()
+    if stats_config.get('engine', 'exact') == 'rollup':
+        # Only the sketches of the affected buurten are rebuilt; every other
+        # level is rolled up again from the stored sketches
+        listings = process_data(fetch_regions(storage, 'buurt', buurten))
+        sketches = listing_sketches(listings, stats_config.get('sketch_relative_accuracy', 0.01))
+        storage.truncate_write(pd.DataFrame({'buurt': buurten}), 'tmp_stats_buurt', schema={'buurt': 'STRING'})
+        try:
+            storage.execute(f"""
+                DELETE FROM {storage.table('stats_sketch')}
+                WHERE buurt IN (SELECT buurt FROM {storage.table('tmp_stats_buurt')})
+            """)
+        finally:
+            storage.drop('tmp_stats_buurt')
+        storage.load(sketches, 'stats_sketch', schema=stats_sketch_schema)
+        stored = storage.query(f"SELECT * FROM {storage.table('stats_sketch')}")
+        stats_df = sketch_statistics(stored, percentile_bounds, min_properties_to_compute_stats)
+    else:
+        # A stadsdeel row needs all the listings of the stadsdeel
+        listings = process_data(fetch_regions(storage, 'stadsdeel', changed['stadsdeel'].dropna().unique().tolist()))
+        stats_df = compute_all_statistics(listings, percentile_bounds, min_properties_to_compute_stats,
+                                          workers=stats_config.get('workers', 1))
+    rows = affected_rows(stats_df, affected)
+    storage.merge_upsert(rows, 'stats', keys=stats_keys, schema=stats_schema,
+                         update_columns=metric_columns + ['number_of_properties'], null_safe_keys=True)
+    print(f'{len(changed)} listings changed since {watermark}, {len(buurten)} buurten and {len(rows)} stats rows updated.')
+
+
+def use_incremental(storage, stats_config, run_date):
+    # Incremental runs need a previous run, a full refresh less than
+    # full_refresh_every_days ago and, for the rollup engine, stored sketches
+    # of the configured accuracy
+    if not stats_config.get('incremental', False):
+        return False
+    last_full_refresh = storage.read_state('stats_full_refresh')
+    if storage.read_state('stats_watermark') is None or last_full_refresh is None:
+        return False
+    if (run_date - date.fromisoformat(last_full_refresh)).days >= stats_config.get('full_refresh_every_days', 7):
+        return False
+    if stats_config.get('engine', 'exact') == 'rollup':
+        accuracies = storage.query(f"SELECT DISTINCT relative_accuracy FROM {storage.table('stats_sketch')}")
+        return accuracies['relative_accuracy'].tolist() == [stats_config.get('sketch_relative_accuracy', 0.01)]
+    return True
 
-    job = client.load_table_from_dataframe(
-        df, table_id, job_config=job_config
-    )
 
-    job.result()
-    print(f"Table {table_id} updated successfully.")
-                        
 def main():
     with open('config/stats_config.json', 'r') as f:
         stats_config = json.load(f)
     with open('config/bigquery_config.json', 'r') as f:
         bigquery_config = json.load(f)
+    with open('config/storage_config.json', 'r') as f:
+        storage_config = json.load(f)
+    storage = get_storage(storage_config, bigquery_config)
     
     percentile_bounds = [stats_config['outliers_percentile_lower'], stats_config['outliers_percentile_upper']]
     min_properties_to_compute_stats = stats_config['min_properties_to_compute_stats']
     
-    df = fetch_data(bigquery_config)
-    processed_df = process_data(df)
-    
-    stats_df = run_stats_computation(processed_df, percentile_bounds, min_properties_to_compute_stats)
-    
-    upload_dataframe_to_bigquery(stats_df, bigquery_config)
+    # The watermark is the day the run starts, changes of that day are
+    # picked up again by the next run
+    run_date = date.today()
+    if use_incremental(storage, stats_config, run_date):
+        refresh_statistics(storage, stats_config, storage.read_state('stats_watermark'), percentile_bounds,
+                           min_properties_to_compute_stats)
+    else:
+        df = fetch_data(storage)
+        processed_df = process_data(df)
+
+        if stats_config.get('engine', 'exact') == 'rollup':
+            sketches = listing_sketches(processed_df, stats_config.get('sketch_relative_accuracy', 0.01))
+            storage.truncate_write(sketches, 'stats_sketch', schema=stats_sketch_schema)
+            stats_df = sketch_statistics(sketches, percentile_bounds, min_properties_to_compute_stats)
+        else:
+            stats_df = compute_all_statistics(processed_df, percentile_bounds, min_properties_to_compute_stats,
+                                              workers=stats_config.get('workers', 1))
+
+        upload_dataframe(stats_df, storage)
+        storage.write_state('stats_full_refresh', str(run_date))
+    storage.write_state('stats_watermark', str(run_date))
     
 if __name__ == "__main__":
     main()
@@ -0,0 +1,485 @@
+import argparse
+import json
+import time
+import numpy as np
+import pandas as pd
+from stats_engine import (resolutions, value_columns, stats_columns, metric_columns, stat_cells, cell_membership,
+                          region_codes, resolution_frame, compute_all_statistics)
+
+# Computes the stats from mergeable summaries instead of from the listings
+# at every resolution. Listings are summarized once per (buurt, cell, value
+# column) as a log-bucket histogram in the style of DDSketch: bucket i holds
+# the values v with floor(log(v) / log(1 + relative_accuracy)) == i, and for
+# each bucket the count, the sum of log(v) and of log(v)^2, the smallest and
+# largest value and how many listings have each of those two. Two histograms
+# merge bucket by bucket (sums add, the extremes combine with the counts of
+# the side they come from), so wijken, subdivisions and stadsdelen are a
+# groupby over their buurten along the postcode_gwb hierarchy, and each
+# coarser level only costs a groupby over the already small summaries of the
+# level below.
+#
+# Within a bucket the values between its min and max are taken to be evenly
+# spread, so buckets holding one or two distinct values (room counts, or the
+# eleven listings at €805 in a subdivision) are exact. Quantiles, the outlier
+# bounds and the trimming follow compute_statistics on those estimated
+# values. An estimated value is in the same bucket as the exact one, so the
+# outlier bounds and the quartiles are within relative_accuracy of the exact
+# ones as long as the trimming keeps the same number of listings; when a
+# bound falls inside a bucket it can keep one more or one less. The mode is
+# taken over the bucket extremes and is exact unless it is a value in the
+# middle of a bucket. The number of properties is exact. `python rollup.py`
+# reports the errors against compute_all_statistics.
+#
+# The buurt level sketches are what compute_stats persists (stats_sketch);
+# sketches of more listings, e.g. of a later day, merge into them with
+# merge_sketches and the stats of every level follow from sketch_statistics
+# without the listings.
+
+# Each resolution is rolled up from the one before it; adding a level (say
+# gemeente) means appending it here and to stats_engine.region_columns
+rollup_levels = ['buurt', 'wijk', 'stadsdeel_onderverdeling', 'stadsdeel']
+hierarchy_columns = ['stadsdeel', 'stadsdeel_onderverdeling', 'wijk', 'wijk_code', 'buurt', 'buurt_code']
+cell_columns = ['post_type', 'property_type', 'furnished']
+summary_columns = ['count', 'log_sum', 'log_square_sum', 'value_min', 'value_min_count', 'value_max',
+                   'value_max_count']
+# Buckets for values whose log is -inf (zero) or inf, and for listings
+# without the value, which only count towards the number of properties
+infinite_buckets = {-np.inf: -2 ** 40, np.inf: 2 ** 40}
+missing_bucket = 2 ** 41
+
+# Buurt level sketches as persisted, one row per bucket. Rows of the same
+# buurt, cell, value column and bucket built with the same relative_accuracy
+# merge (see merge_sketches).
+stats_sketch_schema = {
+    "stadsdeel": "STRING",
+    "stadsdeel_onderverdeling": "STRING",
+    "wijk": "STRING",
+    "wijk_code": "STRING",
+    "buurt": "STRING",
+    "buurt_code": "STRING",
+    "post_type": "STRING",
+    "property_type": "STRING",
+    "furnished": "STRING",
+    "value": "STRING",
+    "relative_accuracy": "FLOAT",
+    "bucket": "INTEGER",
+    "count": "INTEGER",
+    "log_sum": "FLOAT",
+    "log_square_sum": "FLOAT",
+    "value_min": "FLOAT",
+    "value_min_count": "INTEGER",
+    "value_max": "FLOAT",
+    "value_max_count": "INTEGER"
+}
+sketch_keys = hierarchy_columns + cell_columns + ['value', 'relative_accuracy', 'bucket']
+
+
+def bucket_index(logs, relative_accuracy):
+    with np.errstate(invalid='ignore'):
+        buckets = np.floor(logs / np.log1p(relative_accuracy))
+    for value, bucket in infinite_buckets.items():
+        buckets[logs == value] = bucket
+    buckets[np.isnan(logs)] = missing_bucket
+    return buckets.astype(np.int64)
+
+
+def merge_summaries(summaries, keys):
+    groups = summaries.groupby(keys, sort=False, dropna=False).ngroup().to_numpy()
+    n_groups = groups.max(initial=-1) + 1
+    first = np.full(n_groups, len(groups))
+    np.minimum.at(first, groups, np.arange(len(groups)))
+    merged = summaries[keys].iloc[first].reset_index(drop=True)
+    for column in ['count', 'log_sum', 'log_square_sum']:
+        merged[column] = np.bincount(groups, weights=summaries[column], minlength=n_groups)
+    merged['count'] = merged['count'].astype(np.int64)
+    # Only the rows holding the merged min (max) add to its count
+    for extreme, reduce in (('value_min', np.fmin), ('value_max', np.fmax)):
+        values = summaries[extreme].to_numpy(dtype='float64')
+        result = np.full(n_groups, np.nan)
+        reduce.at(result, groups, values)
+        merged[extreme] = result
+        merged[f'{extreme}_count'] = np.bincount(groups, weights=np.where(values == result[groups],
+                                                                           summaries[f'{extreme}_count'], 0),
+                                                 minlength=n_groups).astype(np.int64)
+    return merged
+
+
+def leaf_summaries(df, leaf_codes, rows, cells_of_rows, relative_accuracy):
+    # Histograms per (leaf region, cell, value column). Listings without a
+    # buurt are left out, postcode_gwb gives a postcode all levels or none.
+    in_region = leaf_codes[rows] >= 0
+    pair_rows = rows[in_region]
+    leaves = leaf_codes[pair_rows]
+    cells = cells_of_rows[in_region]
+
+    frames = []
+    for v, column_name in enumerate(value_columns):
+        values = df[column_name].to_numpy(dtype='float64')[pair_rows]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            logs = np.log(values)
+        frames.append(pd.DataFrame({
+            'region': leaves,
+            'cell': cells,
+            'value': v,
+            'bucket': bucket_index(logs, relative_accuracy),
+            'count': 1,
+            'log_sum': np.nan_to_num(logs, nan=0.0, posinf=np.inf, neginf=-np.inf),
+            'log_square_sum': np.nan_to_num(logs ** 2, nan=0.0, posinf=np.inf),
+            'value_min': values,
+            'value_min_count': 1,
+            'value_max': values,
+            'value_max_count': 1,
+        }))
+    return merge_summaries(pd.concat(frames), ['region', 'cell', 'value', 'bucket'])
+
+
+def roll_up(summaries, parent_codes):
+    # Merges the histograms of each region into its parent's
+    summaries = summaries.assign(region=parent_codes[summaries['region'].to_numpy()])
+    return merge_summaries(summaries, ['region', 'cell', 'value', 'bucket'])
+
+
+def parent_codes(df, child, parent, child_regions, parent_regions):
+    # Region code at the parent level for every region code at the child
+    # level, following the first listing of the child like compute_statistics
+    first = df.drop_duplicates(child).set_index(child)[parent].reindex(child_regions)
+    return pd.Index(parent_regions).get_indexer(first).astype(np.int64)
+
+
+class Buckets():
+    # The sorted buckets of one value column, with the listings of each taken
+    # as min_count times its min, then the rest evenly spread strictly
+    # between min and max, then max_count times its max. starts/counts select
+    # the listings kept by the trimming.
+
+    def __init__(self, summaries, groups, n_groups):
+        self.groups = groups
+        self.n_groups = n_groups
+        self.lows = summaries['value_min'].to_numpy(dtype='float64')
+        self.highs = summaries['value_max'].to_numpy(dtype='float64')
+        self.counts = summaries['count'].to_numpy(dtype=np.int64)
+        single = self.lows == self.highs
+        # A bucket with a single value is all min
+        self.low_counts = np.where(single, self.counts, summaries['value_min_count'].to_numpy(dtype=np.int64))
+        self.high_counts = np.where(single, 0, summaries['value_max_count'].to_numpy(dtype=np.int64))
+        self.middle = self.counts - self.low_counts - self.high_counts
+        with np.errstate(invalid='ignore'):
+            self.step = (self.highs - self.lows) / (self.middle + 1)
+        self.starts = np.zeros(len(groups), dtype=np.int64)
+        self.set_kept(self.counts)
+
+    def set_kept(self, kept):
+        self.kept = kept
+        self.cumulative = np.cumsum(kept)
+        self.totals = np.bincount(self.groups, weights=kept, minlength=self.n_groups).astype(np.int64)
+        self.offsets = np.cumsum(self.totals) - self.totals
+
+    def values_at(self, positions, index):
+        # Estimated value of the listing at index (0 based) within bucket positions
+        lows = self.lows[positions]
+        low_counts = self.low_counts[positions]
+        middle = index - low_counts + 1
+        with np.errstate(invalid='ignore'):
+            return np.where(index < low_counts, lows,
+                            np.where(middle > self.middle[positions], self.highs[positions],
+                                     lows + self.step[positions] * middle))
+
+    def rank_values(self, has, ranks):
+        # Estimated value at each rank (0 based) among the kept listings
+        targets = self.offsets[has] + ranks
+        positions = np.searchsorted(self.cumulative, targets, side='right')
+        within = targets - (self.cumulative[positions] - self.kept[positions])
+        return self.values_at(positions, self.starts[positions] + within)
+
+    def quantile(self, q, log=False):
+        # group_quantile on the estimated values of each group, or on their
+        # logs for the outlier bounds like column_statistics
+        result = np.full(self.n_groups, np.nan)
+        has = self.totals > 0
+        n = self.totals[has]
+        virtual = (n - 1) * np.true_divide(np.float64(q) * 100.0, 100)
+        previous = np.floor(virtual)
+        gamma = virtual - previous
+        previous = previous.astype(np.int64)
+        a = self.rank_values(has, previous)
+        b = self.rank_values(has, np.minimum(previous + 1, n - 1))
+        with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+            if log:
+                a, b = np.log(a), np.log(b)
+            diff = b - a
+            result[has] = np.where(gamma >= 0.5, b - diff * (1 - gamma), a + diff * gamma)
+        return result
+
+    def trim(self, lower, upper):
+        # Keeps the listings whose log lies within the bounds of their group
+        lower = lower[self.groups]
+        upper = upper[self.groups]
+        counts, low_counts, middle = self.counts, self.low_counts, self.middle
+        with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+            log_lows = np.log(self.lows)
+            log_highs = np.log(self.highs)
+            step = np.where(self.step > 0, self.step, 1)
+            # Values on a bound are kept, up to the rounding of exp(log(value))
+            above = np.ceil((np.exp(lower) - self.lows) / step - 1e-9)
+            below = np.floor((np.exp(upper) - self.lows) / step + 1e-9)
+        above = np.nan_to_num(above, nan=0, posinf=counts.max(initial=0) + 1, neginf=0)
+        below = np.nan_to_num(below, nan=0, posinf=counts.max(initial=0) + 1, neginf=0)
+        spread = self.high_counts > 0
+        first = np.where(log_lows >= lower, 0,
+                         np.where((middle > 0) & (above <= middle), low_counts + above - 1,
+                                  np.where(spread & (log_highs >= lower), counts - self.high_counts, counts)))
+        last = np.where(np.where(spread, log_highs, log_lows) <= upper, counts - 1,
+                        np.where((middle > 0) & (below >= 1), low_counts + np.minimum(below, middle) - 1,
+                                 np.where(log_lows <= upper, low_counts - 1, -1)))
+        first = first.astype(np.int64)
+        last = last.astype(np.int64)
+        kept = np.clip(last - first + 1, 0, None)
+        # Kept listings at the min, at the max and in between
+        self.kept_lows = np.clip(np.minimum(low_counts, last + 1) - first, 0, None)
+        self.kept_highs = np.where(spread, np.clip(last + 1 - np.maximum(first, counts - self.high_counts), 0, None), 0)
+        self.kept_middle = kept - self.kept_lows - self.kept_highs
+        self.starts = first
+        self.set_kept(kept)
+
+    def log_sums(self, summaries):
+        # Sums of the logs and of their squares over the kept listings; exact
+        # for the extremes, the middle gets its share of the middle's sums
+        sums = []
+        for column, power in (('log_sum', 1), ('log_square_sum', 2)):
+            with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+                log_lows = np.log(self.lows) ** power
+                log_highs = np.log(self.highs) ** power
+                middle_sum = (summaries[column].to_numpy() - self.low_counts * log_lows
+                              - self.high_counts * log_highs)
+                kept_sum = (np.where(self.kept_lows > 0, self.kept_lows * log_lows, 0)
+                            + np.where(self.kept_highs > 0, self.kept_highs * log_highs, 0)
+                            + np.where(self.kept_middle > 0, middle_sum * self.kept_middle / self.middle, 0))
+            sums.append(np.bincount(self.groups, weights=kept_sum, minlength=self.n_groups))
+        return sums
+
+    def mode(self):
+        # The most frequent kept extreme, none on a tie; values in the middle
+        # of a bucket count once each
+        result = np.full(self.n_groups, np.nan)
+        values = np.concatenate([self.lows, self.highs])
+        counts = np.concatenate([self.kept_lows, self.kept_highs])
+        groups = np.concatenate([self.groups, self.groups])
+        fullest = np.zeros(self.n_groups, dtype=np.int64)
+        np.maximum.at(fullest, groups, counts)
+        is_fullest = (counts > 0) & (counts == fullest[groups])
+        ties = np.bincount(groups[is_fullest], minlength=self.n_groups)
+        ties += np.where(fullest == 1, np.bincount(self.groups, weights=self.kept_middle,
+                                                   minlength=self.n_groups).astype(np.int64), 0)
+        single = is_fullest & (ties[groups] == 1)
+        result[groups[single]] = values[single]
+        return result
+
+
+def histogram_statistics(summaries, n_groups, n_cells, percentile_bounds):
+    # Same output as stats_engine.column_statistics, for one value column
+    summaries = summaries.sort_values(['region', 'cell', 'bucket'])
+    groups = (summaries['region'] * n_cells + summaries['cell']).to_numpy()
+    buckets = Buckets(summaries, groups, n_groups)
+    buckets.trim(buckets.quantile(percentile_bounds[0], log=True), buckets.quantile(percentile_bounds[1], log=True))
+    kept_counts = buckets.totals
+
+    log_sum, log_square_sum = buckets.log_sums(summaries)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_mean = log_sum / kept_counts
+        log_var = (log_square_sum - kept_counts * log_mean ** 2) / (kept_counts - 1)
+        log_std = np.sqrt(np.clip(log_var, 0, None))
+    log_mean[kept_counts == 0] = np.nan
+    log_std[kept_counts < 2] = np.nan
+
+    with np.errstate(invalid='ignore', over='ignore'):
+        metrics = {
+            'median': buckets.quantile(0.5),
+            'q1': buckets.quantile(0.25),
+            'q3': buckets.quantile(0.75),
+            'mode': buckets.mode(),
+            'geometric_mean': np.exp(log_mean),
+            'geometric_std': np.exp(log_std),
+            'geometric_conf_int_95_low': np.exp(log_mean - 1.96 * log_std),
+            'geometric_conf_int_95_upp': np.exp(log_mean + 1.96 * log_std),
+            'geometric_conf_int_75_low': np.exp(log_mean - 1.15 * log_std),
+            'geometric_conf_int_75_upp': np.exp(log_mean + 1.15 * log_std),
+            'geometric_conf_int_50_low': np.exp(log_mean - 0.674 * log_std),
+            'geometric_conf_int_50_upp': np.exp(log_mean + 0.674 * log_std),
+        }
+    return kept_counts, metrics
+
+
+def level_statistics(summaries, n_regions, n_cells, percentile_bounds):
+    # Every listing of a cell is in one bucket of each value column, the
+    # missing value bucket included
+    n_groups = n_regions * n_cells
+    first_column = summaries[summaries['value'] == 0]
+    number_of_properties = np.bincount((first_column['region'] * n_cells + first_column['cell']).to_numpy(),
+                                       weights=first_column['count'], minlength=n_groups).astype(np.int64)
+    summaries = summaries[summaries['bucket'] != missing_bucket]
+    results = []
+    for v in range(len(value_columns)):
+        kept_counts, metrics = histogram_statistics(summaries[summaries['value'] == v], n_groups, n_cells,
+                                                    percentile_bounds)
+        results.append((number_of_properties, kept_counts, metrics))
+    return results
+
+
+def cell_keys(post_types, property_types, furnished):
+    return post_types.astype(str) + '|' + property_types.astype(str) + '|' + furnished.fillna('').astype(str)
+
+
+def listing_sketches(df, relative_accuracy=0.01):
+    # Buurt level sketches of the listings in df, labelled for stats_sketch
+    cells = stat_cells()
+    rows, cells_of_rows = cell_membership(df, cells)
+    regions, codes = region_codes(df, 'buurt')
+    summaries = leaf_summaries(df, codes, rows, cells_of_rows, relative_accuracy)
+    region = summaries['region'].to_numpy()
+    cell = summaries['cell'].to_numpy()
+    first_rows = df.drop_duplicates('buurt').set_index('buurt')
+    sketches = pd.DataFrame({'buurt': regions[region]})
+    for column in hierarchy_columns:
+        if column != 'buurt':
+            sketches[column] = first_rows[column].reindex(regions).to_numpy()[region]
+    for i, column in enumerate(cell_columns):
+        sketches[column] = np.array([c[i] for c in cells], dtype=object)[cell]
+    sketches['value'] = np.array(value_columns, dtype=object)[summaries['value'].to_numpy()]
+    sketches['relative_accuracy'] = relative_accuracy
+    for column in ['bucket'] + summary_columns:
+        sketches[column] = summaries[column].to_numpy()
+    return sketches[list(stats_sketch_schema)]
+
+
+def merge_sketches(*sketches):
+    # The sketch of the listings of all the given sketches; they must have
+    # been built with the same relative_accuracy to share buckets
+    return merge_summaries(pd.concat(sketches), sketch_keys)[list(stats_sketch_schema)]
+
+
+def sketch_statistics(sketches, percentile_bounds, min_properties_to_compute_stats):
+    # Stats rows of every resolution from buurt level sketches alone; the
+    # hierarchy and the region labels come from the sketches themselves
+    if sketches['relative_accuracy'].nunique() > 1:
+        raise ValueError('Sketches built with different relative accuracies cannot be merged.')
+    hierarchy = sketches.drop_duplicates('buurt')[hierarchy_columns].reset_index(drop=True)
+    cells = stat_cells()
+    cell_index = pd.Index(cell_keys(*[pd.Series([c[i] for c in cells], dtype=object) for i in range(3)]))
+    coded = {level: region_codes(hierarchy, level) for level in rollup_levels}
+    summaries = pd.DataFrame({
+        'region': pd.Index(coded['buurt'][0]).get_indexer(sketches['buurt']),
+        'cell': cell_index.get_indexer(cell_keys(sketches['post_type'], sketches['property_type'],
+                                                 sketches['furnished'])),
+        'value': pd.Index(value_columns).get_indexer(sketches['value']),
+    })
+    for column in ['bucket'] + summary_columns:
+        summaries[column] = sketches[column].to_numpy()
+    summaries = merge_summaries(summaries[(summaries['region'] >= 0) & (summaries['cell'] >= 0)],
+                                ['region', 'cell', 'value', 'bucket'])
+
+    frames = {}
+    for i, level in enumerate(rollup_levels):
+        if i > 0:
+            child = rollup_levels[i - 1]
+            summaries = roll_up(summaries, parent_codes(hierarchy, child, level, coded[child][0], coded[level][0]))
+        column_results = level_statistics(summaries, len(coded[level][0]), len(cells), percentile_bounds)
+        frames[level] = resolution_frame(hierarchy, level, coded[level][0], cells, column_results,
+                                         min_properties_to_compute_stats)
+    return pd.concat([frames[level] for level in resolutions]).reset_index(drop=True)
+
+
+def compute_rollup_statistics(df, percentile_bounds, min_properties_to_compute_stats, relative_accuracy=0.01):
+    return sketch_statistics(listing_sketches(df, relative_accuracy), percentile_bounds,
+                             min_properties_to_compute_stats)
+
+
+def aligned(exact, approximate):
+    keys = [column for column in stats_columns if column not in metric_columns and column != 'number_of_properties']
+    frames = []
+    for frame in (exact, approximate):
+        frame = frame.copy()
+        for column in keys:
+            frame[column] = frame[column].astype(object).where(frame[column].notna(), '')
+        frames.append(frame.set_index(keys))
+    return frames[0].join(frames[1], how='outer', lsuffix='_exact', rsuffix='_sketch')
+
+
+def accuracy_report(df, percentile_bounds, min_properties_to_compute_stats, accuracies):
+    start = time.perf_counter()
+    exact = compute_all_statistics(df, percentile_bounds, min_properties_to_compute_stats)
+    timings = [{'engine': 'exact', 'seconds': time.perf_counter() - start, 'same counts': True}]
+    errors = []
+    for relative_accuracy in accuracies:
+        start = time.perf_counter()
+        approximate = compute_rollup_statistics(df, percentile_bounds, min_properties_to_compute_stats,
+                                                relative_accuracy)
+        joined = aligned(exact, approximate)
+        timings.append({'engine': f'sketch {relative_accuracy}', 'seconds': time.perf_counter() - start,
+                        'same counts': bool((joined['number_of_properties_exact']
+                                             == joined['number_of_properties_sketch']).all())})
+        for metric in metric_columns:
+            x = pd.to_numeric(joined[f'{metric}_exact'], errors='coerce').to_numpy(dtype='float64')
+            y = pd.to_numeric(joined[f'{metric}_sketch'], errors='coerce').to_numpy(dtype='float64')
+            both = ~np.isnan(x) & ~np.isnan(y)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                error = np.abs(y[both] - x[both]) / np.abs(x[both])
+            error = error[~np.isnan(error)]
+            errors.append({
+                'relative_accuracy': relative_accuracy,
+                'metric': metric,
+                'cells': int(both.sum()),
+                'one side missing': int((np.isnan(x) != np.isnan(y)).sum()),
+                'identical': round(float((x[both] == y[both]).mean()), 4) if both.any() else None,
+                'median error': np.median(error) if len(error) else None,
+                'p99 error': np.percentile(error, 99) if len(error) else None,
+                'max error': error.max() if len(error) else None,
+            })
+    return pd.DataFrame(timings), pd.DataFrame(errors)
+
+
+def same_sketches(a, b):
+    a = a.sort_values(sketch_keys, na_position='first').reset_index(drop=True)
+    b = b.sort_values(sketch_keys, na_position='first').reset_index(drop=True)
+    if len(a) != len(b) or not a[sketch_keys].fillna('').equals(b[sketch_keys].fillna('')):
+        return False
+    return all(np.allclose(a[column], b[column], rtol=1e-12, equal_nan=True) for column in summary_columns)
+
+
+def main():
+    from compute_stats import fetch_data, process_data
+    from storage import get_storage
+    with open('config/stats_config.json', 'r') as f:
+        stats_config = json.load(f)
+    parser = argparse.ArgumentParser(description='Report the accuracy of the sketch stats against the exact ones.')
+    parser.add_argument('--csv', help='Read the listings from a CSV export of fetch_data instead of the storage.')
+    parser.add_argument('--scale', type=int, default=1, help='Repeat the listings this many times.')
+    parser.add_argument('--accuracies', type=float, nargs='+', default=[0.05, 0.02, 0.01, 0.005])
+    args = parser.parse_args()
+
+    if args.csv:
+        df = pd.read_csv(args.csv)
+    else:
+        with open('config/bigquery_config.json', 'r') as f:
+            bigquery_config = json.load(f)
+        with open('config/storage_config.json', 'r') as f:
+            storage_config = json.load(f)
+        df = fetch_data(get_storage(storage_config, bigquery_config))
+    df = process_data(df)
+    df = pd.concat([df] * args.scale).reset_index(drop=True)
+    percentile_bounds = [stats_config['outliers_percentile_lower'], stats_config['outliers_percentile_upper']]
+
+    # Sketches of two halves of the listings merged must be the sketch of all
+    relative_accuracy = stats_config.get('sketch_relative_accuracy', 0.01)
+    halves = np.arange(len(df)) % 2 == 0
+    merged = merge_sketches(listing_sketches(df[halves], relative_accuracy),
+                            listing_sketches(df[~halves], relative_accuracy))
+    print(f'Merged sketches equal the sketch of all listings: {same_sketches(merged, listing_sketches(df, relative_accuracy))}')
+
+    timings, errors = accuracy_report(df, percentile_bounds, stats_config['min_properties_to_compute_stats'],
+                                      args.accuracies)
+    print(timings.to_string(index=False))
+    print(errors.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
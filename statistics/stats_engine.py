@@ -0,0 +1,401 @@
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+# Computes every cell of the stats table in one vectorized pass per region
+# resolution, with the same results as compute_statistics:
+# - every listing is expanded into the (post_type, property_type, furnished)
+#   cells it counts for, so one group id covers region x cell
+# - outliers are trimmed per group on the log values with the same linear
+#   interpolated quantiles pandas uses (np.percentile), computed on values
+#   sorted once by group
+# - medians, quartiles, modes and log mean/std come from sorted or grouped
+#   arrays with np.add.reduceat instead of one DataFrame filter per cell
+# Rows keep the order of the nested loops in run_stats_computation.
+
+resolutions = ['stadsdeel', 'stadsdeel_onderverdeling', 'wijk', 'buurt']
+value_columns = ['price', 'surface', 'rooms', 'price_per_m2', 'price_per_room']
+
+# Stats table columns filled from the region a row is about, per resolution
+region_columns = {
+    'stadsdeel': {'stadsdeel': 'stadsdeel'},
+    'stadsdeel_onderverdeling': {'stadsdeel': 'stadsdeel', 'subdivision': 'stadsdeel_onderverdeling'},
+    'wijk': {'stadsdeel': 'stadsdeel', 'subdivision': 'stadsdeel_onderverdeling', 'wijk': 'wijk',
+             'wijk_code': 'wijk_code'},
+    'buurt': {'stadsdeel': 'stadsdeel', 'subdivision': 'stadsdeel_onderverdeling', 'wijk': 'wijk',
+              'wijk_code': 'wijk_code', 'buurt': 'buurt', 'buurt_code': 'buurt_code'},
+}
+
+stats_columns = [
+    'region_resolution', 'stadsdeel', 'subdivision', 'wijk', 'wijk_code', 'buurt', 'buurt_code', 'post_type',
+    'property_type', 'furnished', 'value', 'median', 'q1', 'q3', 'mode', 'geometric_mean', 'geometric_std',
+    'geometric_conf_int_95_low', 'geometric_conf_int_95_upp', 'geometric_conf_int_75_low',
+    'geometric_conf_int_75_upp', 'geometric_conf_int_50_low', 'geometric_conf_int_50_upp', 'number_of_properties'
+]
+metric_columns = stats_columns[stats_columns.index('median'):-1]
+
+
+def stat_cells():
+    cells = []
+    for post_type in ['Buy', 'Rent']:
+        for property_type in ['All', 'Apartment', 'House']:
+            for furnished in [None, 'All', 'Upholstered', 'Furnished', 'Shell']:
+                if (post_type == 'Buy') != (furnished is None):
+                    continue
+                cells.append((post_type, property_type, furnished))
+    return cells
+
+
+def cell_membership(df, cells):
+    # (row, cell) pairs for every cell a listing is counted in, ordered by row
+    member = np.zeros((len(df), len(cells)), dtype=bool)
+    for i, (post_type, property_type, furnished) in enumerate(cells):
+        rows = (df['post_type'] == post_type).to_numpy()
+        if property_type != 'All':
+            rows &= (df['property_type'] == property_type).to_numpy()
+        if post_type == 'Rent' and furnished != 'All':
+            rows &= (df['furnished'] == furnished).to_numpy()
+        member[:, i] = rows
+    return np.nonzero(member)
+
+
+def group_bounds(counts):
+    ends = np.cumsum(counts)
+    return ends - counts, ends
+
+
+def group_quantile(sorted_values, starts, counts, q):
+    # np.percentile(values, q * 100) per group (linear method), which is what
+    # Series.quantile calls, including its index and interpolation arithmetic
+    q = np.true_divide(np.float64(q) * 100.0, 100)
+    result = np.full(len(counts), np.nan)
+    has = counts > 0
+    n = counts[has]
+    virtual = (n - 1) * q
+    previous = np.floor(virtual)
+    following = previous + 1
+    above = virtual >= n - 1
+    previous[above] = -1
+    following[above] = -1
+    gamma = virtual - previous
+    previous = np.where(previous < 0, n + previous, previous).astype(np.intp) + starts[has]
+    following = np.where(following < 0, n + following, following).astype(np.intp) + starts[has]
+    a = sorted_values[previous]
+    b = sorted_values[following]
+    with np.errstate(invalid='ignore'):
+        diff = b - a
+        lerp = a + diff * gamma
+        lerp = np.where(gamma >= 0.5, b - diff * (1 - gamma), lerp)
+    result[has] = lerp
+    return result
+
+
+def group_median(sorted_values, starts, counts):
+    result = np.full(len(counts), np.nan)
+    has = counts > 0
+    n = counts[has]
+    middle = starts[has] + (n - 1) // 2
+    odd = n % 2 == 1
+    with np.errstate(invalid='ignore'):
+        result[has] = np.where(odd, sorted_values[middle],
+                               (sorted_values[middle] + sorted_values[np.minimum(middle + 1, len(sorted_values) - 1)]) / 2)
+    return result
+
+
+def group_sum(values, starts, counts):
+    result = np.zeros(len(counts))
+    has = counts > 0
+    if has.any():
+        result[has] = np.add.reduceat(values, starts[has])
+    return result
+
+
+def group_mode(sorted_values, groups, n_groups):
+    # The value occurring most often in each group, NaN when there is a tie
+    result = np.full(n_groups, np.nan)
+    if len(sorted_values) == 0:
+        return result
+    new_run = np.ones(len(sorted_values), dtype=bool)
+    new_run[1:] = (groups[1:] != groups[:-1]) | (sorted_values[1:] != sorted_values[:-1])
+    run_starts = np.flatnonzero(new_run)
+    run_lengths = np.diff(np.append(run_starts, len(sorted_values)))
+    run_groups = groups[run_starts]
+    longest = np.zeros(n_groups, dtype=np.int64)
+    np.maximum.at(longest, run_groups, run_lengths)
+    is_longest = run_lengths == longest[run_groups]
+    ties = np.bincount(run_groups[is_longest], minlength=n_groups)
+    single = is_longest & (ties[run_groups] == 1)
+    result[run_groups[single]] = sorted_values[run_starts[single]]
+    return result
+
+
+def column_statistics(values, groups, n_groups, percentile_bounds):
+    # Per group metrics of one value column, values and groups given per
+    # (listing, cell) pair in listing order
+    counts = np.bincount(groups, minlength=n_groups)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logs = np.log(values)
+    valid = ~np.isnan(logs)
+    order = np.lexsort((logs[valid], groups[valid]))
+    sorted_logs = logs[valid][order]
+    valid_counts = np.bincount(groups[valid], minlength=n_groups)
+    starts, _ = group_bounds(valid_counts)
+    lower = group_quantile(sorted_logs, starts, valid_counts, percentile_bounds[0])
+    upper = group_quantile(sorted_logs, starts, valid_counts, percentile_bounds[1])
+    with np.errstate(invalid='ignore'):
+        kept = valid & (logs >= lower[groups]) & (logs <= upper[groups])
+
+    # Stable sort by group keeps listing order inside a group, the order the
+    # sums for the mean and std run in
+    order = np.argsort(groups[kept], kind='stable')
+    kept_groups = groups[kept][order]
+    kept_values = values[kept][order]
+    kept_logs = logs[kept][order]
+    kept_counts = np.bincount(kept_groups, minlength=n_groups)
+    starts, _ = group_bounds(kept_counts)
+
+    by_value = np.lexsort((kept_values, kept_groups))
+    sorted_values = kept_values[by_value]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_mean = group_sum(kept_logs, starts, kept_counts) / kept_counts
+        squares = (log_mean[kept_groups] - kept_logs) ** 2
+        log_std = np.sqrt(group_sum(squares, starts, kept_counts) / (kept_counts - 1))
+    log_mean[kept_counts == 0] = np.nan
+    log_std[kept_counts < 2] = np.nan
+    with np.errstate(invalid='ignore', over='ignore'):
+        metrics = {
+            'median': group_median(sorted_values, starts, kept_counts),
+            'q1': group_quantile(sorted_values, starts, kept_counts, 0.25),
+            'q3': group_quantile(sorted_values, starts, kept_counts, 0.75),
+            'mode': group_mode(sorted_values, kept_groups, n_groups),
+            'geometric_mean': np.exp(log_mean),
+            'geometric_std': np.exp(log_std),
+            'geometric_conf_int_95_low': np.exp(log_mean - 1.96 * log_std),
+            'geometric_conf_int_95_upp': np.exp(log_mean + 1.96 * log_std),
+            'geometric_conf_int_75_low': np.exp(log_mean - 1.15 * log_std),
+            'geometric_conf_int_75_upp': np.exp(log_mean + 1.15 * log_std),
+            'geometric_conf_int_50_low': np.exp(log_mean - 0.674 * log_std),
+            'geometric_conf_int_50_upp': np.exp(log_mean + 0.674 * log_std),
+        }
+    return counts, kept_counts, metrics
+
+
+def region_codes(df, region_resolution):
+    regions = pd.unique(df[region_resolution])
+    codes = pd.Index(regions).get_indexer(df[region_resolution]).astype(np.int64)
+    # Listings without a region are in no region's cells
+    codes[df[region_resolution].isna().to_numpy()] = -1
+    return regions, codes
+
+
+def column_task(values, codes, rows, cells_of_rows, n_regions, n_cells, percentile_bounds):
+    # Statistics of one value column at one resolution, for every region x cell
+    in_region = codes[rows] >= 0
+    pair_rows = rows[in_region]
+    groups = codes[pair_rows] * n_cells + cells_of_rows[in_region]
+    return column_statistics(values[pair_rows], groups, n_regions * n_cells, percentile_bounds)
+
+
+def resolution_frame(df, region_resolution, regions, cells, column_results, min_properties_to_compute_stats):
+    # Output rows are ordered by cell, then value column, then region
+    first_rows = df.drop_duplicates(region_resolution).set_index(region_resolution)
+    region_order = np.tile(np.arange(len(regions)), len(cells) * len(value_columns))
+    cell_order = np.repeat(np.arange(len(cells)), len(regions) * len(value_columns))
+    value_order = np.tile(np.repeat(np.arange(len(value_columns)), len(regions)), len(cells))
+    out = pd.DataFrame({'region_resolution': region_resolution}, index=range(len(region_order)))
+    for stats_column in ['stadsdeel', 'subdivision', 'wijk', 'wijk_code', 'buurt', 'buurt_code']:
+        source = region_columns[region_resolution].get(stats_column)
+        if source == region_resolution:
+            out[stats_column] = regions[region_order]
+        elif source is not None:
+            # Like compute_statistics, taken from the first listing in the region
+            out[stats_column] = first_rows[source].reindex(regions).to_numpy()[region_order]
+        else:
+            out[stats_column] = None
+    out['post_type'] = [cells[i][0] for i in cell_order]
+    out['property_type'] = [cells[i][1] for i in cell_order]
+    out['furnished'] = [cells[i][2] for i in cell_order]
+    out['value'] = [value_columns[i] for i in value_order]
+
+    number_of_properties = np.zeros(len(out), dtype=np.int64)
+    metrics = {column: np.full(len(out), np.nan) for column in metric_columns}
+    for v, (counts, kept_counts, column_metrics) in enumerate(column_results):
+        positions = np.flatnonzero(value_order == v)
+        group_ids = region_order[positions] * len(cells) + cell_order[positions]
+        number_of_properties[positions] = counts[group_ids]
+        enough = kept_counts[group_ids] >= min_properties_to_compute_stats
+        for metric, result in column_metrics.items():
+            metrics[metric][positions[enough]] = result[group_ids[enough]]
+    for metric in metric_columns:
+        out[metric] = metrics[metric]
+    out['mode'] = out['mode'].astype(object).where(out['mode'].notna(), None)
+    out['number_of_properties'] = number_of_properties
+    return out[stats_columns]
+
+
+class SharedArrays():
+    # Numpy arrays copied once into a single shared memory block. Pool workers
+    # attach to it by name and get views on the same memory, so the columns
+    # are not pickled to every worker.
+
+    def __init__(self, arrays):
+        self.layout = {}
+        offset = 0
+        for name, array in arrays.items():
+            self.layout[name] = (array.shape, array.dtype.str, offset)
+            offset += array.nbytes
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for name, array in arrays.items():
+            shape, dtype, offset = self.layout[name]
+            np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset)[...] = array
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+worker_shm = None
+worker_arrays = {}
+
+
+def attach_shared(name, layout):
+    global worker_shm
+    # Spawned workers share the parent's resource tracker, which already has
+    # the block registered; the parent unlinks it once the pool is done
+    worker_shm = shared_memory.SharedMemory(name=name)
+    for array_name, (shape, dtype, offset) in layout.items():
+        worker_arrays[array_name] = np.ndarray(shape, dtype=dtype, buffer=worker_shm.buf, offset=offset)
+
+
+def shared_column_task(region_resolution, column_name, n_regions, n_cells, percentile_bounds):
+    return column_task(worker_arrays[f'value:{column_name}'], worker_arrays[f'codes:{region_resolution}'],
+                       worker_arrays['rows'], worker_arrays['cells_of_rows'], n_regions, n_cells, percentile_bounds)
+
+
+def compute_all_statistics(df, percentile_bounds, min_properties_to_compute_stats, workers=1):
+    # The (resolution, value column) tasks run in a pool of spawned processes
+    # when workers > 1. Every task sums in the same order either way, so the
+    # output does not depend on the number of workers.
+    cells = stat_cells()
+    rows, cells_of_rows = cell_membership(df, cells)
+    coded = {region_resolution: region_codes(df, region_resolution) for region_resolution in resolutions}
+    tasks = [(region_resolution, column_name, len(coded[region_resolution][0]), len(cells), percentile_bounds)
+             for region_resolution in resolutions for column_name in value_columns]
+    if workers > 1:
+        arrays = {'rows': rows.astype(np.int64), 'cells_of_rows': cells_of_rows.astype(np.int64)}
+        for column_name in value_columns:
+            arrays[f'value:{column_name}'] = df[column_name].to_numpy(dtype='float64')
+        for region_resolution in resolutions:
+            arrays[f'codes:{region_resolution}'] = coded[region_resolution][1]
+        shared = SharedArrays(arrays)
+        try:
+            with multiprocessing.get_context('spawn').Pool(
+                    workers, initializer=attach_shared, initargs=(shared.name, shared.layout)) as pool:
+                results = pool.starmap(shared_column_task, tasks)
+        finally:
+            shared.close()
+    else:
+        values = {column_name: df[column_name].to_numpy(dtype='float64') for column_name in value_columns}
+        results = [column_task(values[column_name], coded[region_resolution][1], rows, cells_of_rows, *rest)
+                   for region_resolution, column_name, *rest in tasks]
+
+    frames = []
+    for i, region_resolution in enumerate(resolutions):
+        column_results = results[i * len(value_columns):(i + 1) * len(value_columns)]
+        frames.append(resolution_frame(df, region_resolution, coded[region_resolution][0], cells, column_results,
+                                       min_properties_to_compute_stats))
+    return pd.concat(frames).reset_index(drop=True)
+
+
+def same_statistics(a, b, rtol=1e-12):
+    # Row by row comparison, exact for labels and counts; means and standard
+    # deviations may differ in the last bits depending on summation order
+    a = a[stats_columns].reset_index(drop=True)
+    b = b[stats_columns].reset_index(drop=True)
+    if len(a) != len(b):
+        return False
+    for column in stats_columns:
+        if column in metric_columns:
+            x = pd.to_numeric(a[column], errors='coerce').to_numpy(dtype='float64')
+            y = pd.to_numeric(b[column], errors='coerce').to_numpy(dtype='float64')
+            if not np.allclose(x, y, rtol=rtol, atol=0, equal_nan=True):
+                return False
+        else:
+            x = a[column].astype(object).where(a[column].notna(), None)
+            y = b[column].astype(object).where(b[column].notna(), None)
+            if x.tolist() != y.tolist():
+                return False
+    return True
+
+
+def compare(df, percentile_bounds, min_properties_to_compute_stats, repeat=1, workers=1, reference=True):
+    from compute_stats import run_stats_computation
+    engines = [('single pass', lambda *args: compute_all_statistics(*args))]
+    if reference:
+        engines.insert(0, ('nested loops', run_stats_computation))
+    if workers > 1:
+        engines.append((f'single pass, {workers} workers', lambda *args: compute_all_statistics(*args, workers=workers)))
+    timings = []
+    results = []
+    for name, compute in engines:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = compute(df, percentile_bounds, min_properties_to_compute_stats)
+        results.append(result)
+        timings.append({'engine': name, 'rows': len(result), 'seconds': (time.perf_counter() - start) / repeat})
+    timings = pd.DataFrame(timings)
+    timings['speedup'] = timings['seconds'].iloc[0] / timings['seconds']
+    return timings, all(same_statistics(results[0], result) for result in results[1:])
+
+
+def main():
+    from compute_stats import fetch_data, process_data
+    from storage import get_storage
+    with open('config/stats_config.json', 'r') as f:
+        stats_config = json.load(f)
+    parser = argparse.ArgumentParser(description='Check the single pass stats engine against the nested loops.')
+    parser.add_argument('--csv', help='Read the listings from a CSV export of fetch_data instead of the storage.')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--scale', type=int, nargs='+', default=[1],
+                        help='Repeat the listings this many times; several values give one timing table each, '
+                             'e.g. to see from which size --workers pays off.')
+    parser.add_argument('--workers', type=int, default=stats_config.get('workers', 1))
+    parser.add_argument('--no-reference', action='store_true', help='Skip the (slow) nested loops.')
+    args = parser.parse_args()
+
+    if args.csv:
+        df = pd.read_csv(args.csv)
+    else:
+        with open('config/bigquery_config.json', 'r') as f:
+            bigquery_config = json.load(f)
+        with open('config/storage_config.json', 'r') as f:
+            storage_config = json.load(f)
+        df = fetch_data(get_storage(storage_config, bigquery_config))
+    # Scaled after process_data, which would drop the copies as duplicates
+    df = process_data(df)
+    percentile_bounds = [stats_config['outliers_percentile_lower'], stats_config['outliers_percentile_upper']]
+    identical = True
+    for scale in args.scale:
+        timings, same = compare(pd.concat([df] * scale).reset_index(drop=True), percentile_bounds,
+                                stats_config['min_properties_to_compute_stats'], args.repeat, args.workers,
+                                not args.no_reference)
+        print(f'{len(df) * scale} listings (scale {scale}):')
+        print(timings.to_string(index=False))
+        identical = identical and same
+    if not identical:
+        print('The engines produced different statistics.')
+        sys.exit(1)
+    print('All engines produced the same statistics.')
+
+
+if __name__ == "__main__":
+    main()
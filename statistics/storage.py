@@ -0,0 +1,395 @@
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime, timezone
+import pandas as pd
+
+# Storage backends shared by the scraper, statistics and app services. Each
+# service ships its own copy of this file (like config/bigquery_config.json),
+# keep them in sync: edit this one, copy it over, and scraper/tests checks
+# that the copies match.
+#
+# Schemas use the same {"column": "TYPE"} layout as schemas/*.json.
+# SQL passed to query()/execute() should reference tables through table(name)
+# and stick to syntax both BigQuery and DuckDB accept (DATE '2024-01-01'
+# literals, single-quoted strings, UPDATE ... FROM).
+
+duckdb_types = {
+    'STRING': 'VARCHAR',
+    'INTEGER': 'BIGINT',
+    'INT64': 'BIGINT',
+    'FLOAT': 'DOUBLE',
+    'FLOAT64': 'DOUBLE',
+    'NUMERIC': 'DOUBLE',
+    'BOOLEAN': 'BOOLEAN',
+    'DATE': 'DATE',
+    'TIMESTAMP': 'TIMESTAMP',
+}
+
+
+# Types in BigQuery DDL, where the legacy names of the schema files are not all accepted
+bigquery_ddl_types = {
+    'INTEGER': 'INT64',
+    'FLOAT': 'FLOAT64',
+    'BOOLEAN': 'BOOL',
+}
+
+
+# Small key/value table the services keep their watermarks in
+pipeline_state_schema = {
+    "name": "STRING",
+    "value": "STRING",
+    "updated_at": "TIMESTAMP"
+}
+
+
+def load_schema(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+class Storage():
+
+    def table(self, name):
+        raise NotImplementedError
+
+    def query(self, sql):
+        raise NotImplementedError
+
+    def execute(self, sql):
+        raise NotImplementedError
+
+    def load(self, df, table, schema=None, write_disposition='WRITE_APPEND'):
+        raise NotImplementedError
+
+    def truncate_write(self, df, table, schema=None):
+        self.load(df, table, schema=schema, write_disposition='WRITE_TRUNCATE')
+
+    def merge_upsert(self, df, table, keys, schema, insert_columns=None, update_columns=(),
+                     update_values=None, insert_values=None, null_safe_keys=False):
+        # Rows of df whose keys match a row of table get update_columns copied
+        # over and update_values (column -> SQL expression) set; the other rows
+        # are inserted with insert_columns taken from df plus insert_values.
+        raise NotImplementedError
+
+    def update_matching(self, df, table, keys, schema, update_values):
+        # Sets update_values (column -> SQL expression) on the rows of table
+        # whose keys appear in df, in one statement
+        raise NotImplementedError
+
+    def drop(self, table):
+        raise NotImplementedError
+
+    def dry_run_bytes(self, sql):
+        # Bytes the query would scan, None when the backend cannot tell
+        return None
+
+    def provision(self, table, schema, partition=None, cluster=()):
+        # Creates table with the schema, partitioned by the DATE column
+        # partition and clustered by the cluster columns, or brings an existing
+        # table to that layout. Returns what was done.
+        raise NotImplementedError
+
+    def read_state(self, name):
+        # Value stored under name in pipeline_state, None when it is not set
+        try:
+            df = self.query(f"SELECT value FROM {self.table('pipeline_state')} WHERE name = '{name}'")
+        except Exception as e:
+            logging.info(f'Could not read {name} from pipeline_state: {e}')
+            return None
+        return df['value'].iloc[0] if len(df) else None
+
+    def write_state(self, name, value):
+        df = pd.DataFrame({
+            'name': [name],
+            'value': [value],
+            'updated_at': [datetime.now(timezone.utc).replace(tzinfo=None)]
+        })
+        self.merge_upsert(df, 'pipeline_state', keys=['name'], schema=pipeline_state_schema,
+                          update_columns=['value', 'updated_at'])
+
+    def merge_parts(self, target, source, keys, insert_columns, update_columns, update_values, insert_values,
+                    null_safe_keys):
+        insert_columns = list(insert_columns)
+        update_values = update_values or {}
+        insert_values = insert_values or {}
+        operator = 'IS NOT DISTINCT FROM' if null_safe_keys else '='
+        on = ' AND '.join(f'{target}.{k} {operator} {source}.{k}' for k in keys)
+        updates = [f'{c} = {source}.{c}' for c in update_columns] + [f'{c} = {v}' for c, v in update_values.items()]
+        columns = insert_columns + list(insert_values.keys())
+        values = [f'{source}.{c}' for c in insert_columns] + list(insert_values.values())
+        return on, ', '.join(updates), ', '.join(columns), ', '.join(values)
+
+
+class BigQueryStorage(Storage):
+
+    def __init__(self, project_id, dataset_id):
+        self.project_id = project_id
+        self.dataset_id = dataset_id
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from google.cloud import bigquery
+            self._client = bigquery.Client()
+        return self._client
+
+    def table_id(self, name):
+        return f'{self.project_id}.{self.dataset_id}.{name}'
+
+    def table(self, name):
+        return f'`{self.table_id(name)}`'
+
+    def query(self, sql):
+        return self.client.query(sql).result().to_dataframe()
+
+    def execute(self, sql):
+        self.client.query(sql).result()
+
+    def load(self, df, table, schema=None, write_disposition='WRITE_APPEND'):
+        from google.cloud import bigquery
+        job_config = bigquery.LoadJobConfig(write_disposition=write_disposition)
+        if schema is not None:
+            job_config.schema = [bigquery.SchemaField(name, typ) for name, typ in schema.items()]
+        job = self.client.load_table_from_dataframe(df, self.table_id(table), job_config=job_config)
+        job.result()
+
+    def merge_upsert(self, df, table, keys, schema, insert_columns=None, update_columns=(),
+                     update_values=None, insert_values=None, null_safe_keys=False):
+        tmp_table = f'tmp_{table}'
+        self.truncate_write(df, tmp_table, schema=schema)
+        on, updates, columns, values = self.merge_parts(
+            'target', 'source', keys, insert_columns or schema.keys(), update_columns, update_values,
+            insert_values, null_safe_keys
+        )
+        sql = f"""
+            MERGE {self.table(table)} AS target
+            USING {self.table(tmp_table)} AS source
+            ON {on}
+        """
+        if updates:
+            sql += f"""
+            WHEN MATCHED THEN
+            UPDATE SET {updates}
+            """
+        sql += f"""
+            WHEN NOT MATCHED THEN
+            INSERT ({columns})
+            VALUES ({values})
+        """
+        try:
+            self.execute(sql)
+        finally:
+            self.drop(tmp_table)
+
+    def update_matching(self, df, table, keys, schema, update_values):
+        tmp_table = f'tmp_{table}_keys'
+        self.truncate_write(df[list(keys)], tmp_table, schema={k: schema[k] for k in keys})
+        on, updates, _, _ = self.merge_parts('target', 'source', keys, (), (), update_values, None, False)
+        try:
+            self.execute(f"""
+                UPDATE {self.table(table)} AS target
+                SET {updates}
+                FROM {self.table(tmp_table)} AS source
+                WHERE {on}
+            """)
+        finally:
+            self.drop(tmp_table)
+
+    def drop(self, table):
+        self.client.delete_table(self.table_id(table), not_found_ok=True)
+
+    def dry_run_bytes(self, sql):
+        from google.cloud import bigquery
+        job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+        return self.client.query(sql, job_config=job_config).total_bytes_processed
+
+    def provision(self, table, schema, partition=None, cluster=()):
+        from google.cloud import bigquery
+        from google.api_core.exceptions import NotFound
+        cluster = list(cluster)
+        try:
+            current = self.client.get_table(self.table_id(table))
+        except NotFound:
+            new = bigquery.Table(self.table_id(table), schema=[bigquery.SchemaField(n, t) for n, t in schema.items()])
+            if partition:
+                new.time_partitioning = bigquery.TimePartitioning(field=partition)
+            if cluster:
+                new.clustering_fields = cluster
+            self.client.create_table(new)
+            return 'created'
+
+        done = []
+        existing = {field.name for field in current.schema}
+        missing = [c for c in schema if c not in existing]
+        for column in missing:
+            self.execute(f'ALTER TABLE {self.table(table)} ADD COLUMN IF NOT EXISTS {column} '
+                         f'{bigquery_ddl_types.get(schema[column], schema[column])}')
+        if missing:
+            done.append(f"added {', '.join(missing)}")
+        current_partition = current.time_partitioning.field if current.time_partitioning else None
+        if current_partition != partition or list(current.clustering_fields or []) != cluster:
+            # Partitioning can only be set when a table is created, so the table
+            # is recreated from itself in one statement
+            layout = f' PARTITION BY {partition}' if partition else ''
+            layout += f" CLUSTER BY {', '.join(cluster)}" if cluster else ''
+            self.execute(f'CREATE OR REPLACE TABLE {self.table(table)}{layout} AS SELECT * FROM {self.table(table)}')
+            done.append('rewritten with the new layout')
+        return ', '.join(done) or 'unchanged'
+
+
+class DuckDBStorage(Storage):
+    # Local stand-in for BigQuery: every table is a Parquet file in path and
+    # DuckDB is the query engine. Tables that do not exist yet are created
+    # from schemas_dir/<table>.json.
+
+    def __init__(self, path, schemas_dir=None):
+        import duckdb
+        self.path = path
+        self.schemas_dir = schemas_dir
+        os.makedirs(path, exist_ok=True)
+        self.con = duckdb.connect()
+        self.loaded = set()
+        self.lock = threading.RLock()
+
+    def parquet_path(self, name):
+        return os.path.join(self.path, f'{name}.parquet')
+
+    def create_table(self, name, schema):
+        columns = ', '.join(f'"{c}" {duckdb_types.get(t.upper(), t)}' for c, t in schema.items())
+        self.con.execute(f'CREATE OR REPLACE TABLE "{name}" ({columns})')
+
+    def ensure_table(self, name, schema=None, df=None):
+        with self.lock:
+            if name in self.loaded:
+                return
+            if os.path.exists(self.parquet_path(name)):
+                self.con.execute(f'CREATE OR REPLACE TABLE "{name}" AS SELECT * FROM read_parquet(?)',
+                                 [self.parquet_path(name)])
+            else:
+                schema_path = os.path.join(self.schemas_dir, f'{name}.json') if self.schemas_dir else None
+                if schema is None and schema_path and os.path.exists(schema_path):
+                    schema = load_schema(schema_path)
+                if schema is not None:
+                    self.create_table(name, schema)
+                elif df is not None:
+                    self.con.register('_ensure_df', df)
+                    self.con.execute(f'CREATE OR REPLACE TABLE "{name}" AS SELECT * FROM _ensure_df LIMIT 0')
+                    self.con.unregister('_ensure_df')
+                else:
+                    raise ValueError(f'No schema found for table {name}')
+            self.loaded.add(name)
+
+    def persist(self, name):
+        tmp_path = self.parquet_path(name) + '.tmp'
+        self.con.execute(f'COPY "{name}" TO \'{tmp_path}\' (FORMAT PARQUET)')
+        os.replace(tmp_path, self.parquet_path(name))
+
+    def table(self, name):
+        self.ensure_table(name)
+        return f'"{name}"'
+
+    def query(self, sql):
+        with self.lock:
+            return self.con.execute(sql).df()
+
+    def execute(self, sql):
+        with self.lock:
+            self.con.execute(sql)
+            match = re.match(r'\s*(?:UPDATE|DELETE\s+FROM|INSERT\s+INTO)\s+"([^"]+)"', sql, flags=re.IGNORECASE)
+            if match and match.group(1) in self.loaded:
+                self.persist(match.group(1))
+
+    def insert_dataframe(self, df, name):
+        table_columns = [row[0] for row in self.con.execute(f'DESCRIBE "{name}"').fetchall()]
+        columns = ', '.join(f'"{c}"' for c in df.columns if c in table_columns)
+        self.con.register('_load_df', df)
+        try:
+            self.con.execute(f'INSERT INTO "{name}" BY NAME SELECT {columns} FROM _load_df')
+        finally:
+            self.con.unregister('_load_df')
+
+    def load(self, df, table, schema=None, write_disposition='WRITE_APPEND'):
+        with self.lock:
+            if write_disposition == 'WRITE_TRUNCATE' and schema is not None:
+                self.create_table(table, schema)
+                self.loaded.add(table)
+            else:
+                self.ensure_table(table, schema=schema, df=df)
+                if write_disposition == 'WRITE_TRUNCATE':
+                    self.con.execute(f'DELETE FROM "{table}"')
+            self.insert_dataframe(df, table)
+            self.persist(table)
+
+    def merge_upsert(self, df, table, keys, schema, insert_columns=None, update_columns=(),
+                     update_values=None, insert_values=None, null_safe_keys=False):
+        with self.lock:
+            self.ensure_table(table)
+            self.con.register('_merge_df', df)
+            try:
+                on, updates, columns, values = self.merge_parts(
+                    f'"{table}"', 'source', keys, insert_columns or schema.keys(), update_columns, update_values,
+                    insert_values, null_safe_keys
+                )
+                if updates:
+                    self.con.execute(f'UPDATE "{table}" SET {updates} FROM _merge_df AS source WHERE {on}')
+                self.con.execute(f"""
+                    INSERT INTO "{table}" ({columns})
+                    SELECT {values} FROM _merge_df AS source
+                    WHERE NOT EXISTS (SELECT 1 FROM "{table}" WHERE {on})
+                """)
+            finally:
+                self.con.unregister('_merge_df')
+            self.persist(table)
+
+    def update_matching(self, df, table, keys, schema, update_values):
+        with self.lock:
+            self.ensure_table(table)
+            self.con.register('_update_df', df[list(keys)])
+            try:
+                on, updates, _, _ = self.merge_parts(f'"{table}"', 'source', keys, (), (), update_values, None, False)
+                self.con.execute(f'UPDATE "{table}" SET {updates} FROM _update_df AS source WHERE {on}')
+            finally:
+                self.con.unregister('_update_df')
+            self.persist(table)
+
+    def drop(self, table):
+        with self.lock:
+            self.con.execute(f'DROP TABLE IF EXISTS "{table}"')
+            self.loaded.discard(table)
+            if os.path.exists(self.parquet_path(table)):
+                os.remove(self.parquet_path(table))
+
+    def provision(self, table, schema, partition=None, cluster=()):
+        # Parquet files have no partitions; sorting by the cluster columns gives
+        # row groups with narrow min/max statistics that DuckDB can skip
+        with self.lock:
+            created = not os.path.exists(self.parquet_path(table)) and table not in self.loaded
+            self.ensure_table(table, schema=schema)
+            existing = [row[0] for row in self.con.execute(f'DESCRIBE "{table}"').fetchall()]
+            missing = [c for c in schema if c not in existing]
+            for column in missing:
+                self.con.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}" '
+                                 f'{duckdb_types.get(schema[column].upper(), schema[column])}')
+            if cluster:
+                order = ', '.join(f'"{c}"' for c in cluster)
+                self.con.execute(f'CREATE OR REPLACE TABLE "{table}" AS SELECT * FROM "{table}" ORDER BY {order}')
+            self.persist(table)
+        if created:
+            return 'created'
+        done = [f"added {', '.join(missing)}"] if missing else []
+        if cluster:
+            done.append(f"sorted by {', '.join(cluster)}")
+        return ', '.join(done) or 'unchanged'
+
+
+def get_storage(storage_config, bigquery_config):
+    backend = storage_config.get('backend', 'bigquery')
+    if backend == 'bigquery':
+        return BigQueryStorage(bigquery_config['project_id'], bigquery_config['dataset_id'])
+    elif backend == 'duckdb':
+        return DuckDBStorage(storage_config['duckdb_path'], storage_config.get('schemas_dir'))
+    raise ValueError(f'Unknown storage backend: {backend}')